@@ -1,5 +1,5 @@
-from sm3 import sm3_hash, padding, IV
-import struct
+from sm3 import SM3, sm3_hash, padding_suffix, IV
+from typing import Iterator, Tuple
 
 # 将哈希字符串转成初始向量格式
 def parse_hash(hash_str: str) -> list:
@@ -10,19 +10,41 @@ def length_extension_attack(original_hash: str, original_len: int, append_data:
     # 解析原始哈希为初始向量
     initial_vector = parse_hash(original_hash)
     
-    # 计算原始消息的填充
-    original_message = b'x' * original_len  # 不需要知道真实消息内容
-    padded_original = padding(original_message)
-    padding_len = len(padded_original) - original_len
+    # 原始消息的填充只与长度有关，直接由长度生成
+    glue = padding_suffix(original_len)
     
-    # 构造扩展消息
-    extended_message = original_message + padded_original[original_len:] + append_data
+    # 构造扩展消息（原始消息部分用占位字节，不需要知道真实消息内容）
+    extended_message = b'x' * original_len + glue + append_data
     
-    # 从原始哈希继续计算附加数据的哈希
-    forged_hash = sm3_hash(append_data, initial_vector)
+    # 从原始哈希对应的中间状态继续计算附加数据的哈希，
+    # 已压缩长度为原始消息加填充的长度，最终填充中的长度字段才与扩展消息一致
+    forged_hash = SM3(append_data, initial_vector, length=original_len + len(glue)).hexdigest()
     
     return forged_hash, extended_message
 
+# 批量长度扩展攻击：对[min_len, max_len]内每个可能的原始消息长度生成伪造结果
+# 逐个产出 (原始长度, 伪造哈希, 扩展部分)，扩展部分 = 填充 || 附加数据，需拼接在真实原始消息之后
+def length_extension_attack_range(original_hash: str, append_data: bytes,
+                                  min_len: int, max_len: int) -> Iterator[Tuple[int, str, bytes]]:
+    # 初始向量只解析一次，所有猜测共用
+    initial_vector = parse_hash(original_hash)
+    
+    # 附加数据中的完整分组与猜测长度无关，只压缩一次
+    full = len(append_data) - len(append_data) % 64
+    midstate = SM3(memoryview(append_data)[:full], initial_vector).midstate()[0]
+    tail = append_data[full:]
+    
+    processed = None
+    forged_hash = None
+    for original_len in range(min_len, max_len + 1):
+        glue = padding_suffix(original_len)
+        # 原始消息加填充的总长度只在跨过分组边界时变化，
+        # 其余长度的伪造哈希完全相同，无需重新压缩
+        if original_len + len(glue) != processed:
+            processed = original_len + len(glue)
+            forged_hash = SM3(tail, midstate, length=processed + full).hexdigest()
+        yield original_len, forged_hash, glue + append_data
+
 # 验证长度扩展攻击
 def verify_length_extension():
     # 原始消息
@@ -39,8 +61,9 @@ def verify_length_extension():
     forged_hash, extended_message = length_extension_attack(original_hash, original_len, append_data)
     print(f"扩展消息长度: {len(extended_message)}字节")
     
-    # 计算真实的扩展消息哈希（用于验证）
-    true_extended_hash = sm3_hash(extended_message)
+    # 计算真实的扩展消息哈希（用于验证）：extended_message中原始消息部分只是占位，
+    # 需替换为真实的原始消息
+    true_extended_hash = sm3_hash(original_message + extended_message[original_len:])
     print(f"真实扩展哈希: {true_extended_hash}")
     print(f"伪造扩展哈希: {forged_hash}")
     
@@ -50,5 +73,18 @@ def verify_length_extension():
     else:
         print("长度扩展攻击验证失败!")
 
+# 验证批量长度扩展攻击：原始消息长度在猜测范围内时，对应长度的伪造结果应当正确
+def verify_length_extension_range(max_len: int = 300):
+    secret = b"k" * 137
+    original_hash = sm3_hash(secret)
+    append_data = b"&admin=true" * 10
+    
+    hits = 0
+    for guess_len, forged_hash, extension in length_extension_attack_range(original_hash, append_data, 1, max_len):
+        if guess_len == len(secret):
+            hits += forged_hash == sm3_hash(secret + extension)
+    print(f"批量长度扩展攻击: 尝试长度 1-{max_len}，真实长度 {len(secret)} {'验证成功' if hits else '验证失败'}")
+
 if __name__ == "__main__":
     verify_length_extension()
+    verify_length_extension_range()
@@ -1,44 +1,203 @@
-from sm3 import sm3_hash_optimized
+from sm3 import sm3_digest, sm3_digest_batch
+import binascii
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
 import math
-from typing import List, Tuple, Optional
+from typing import Iterable, List, Tuple, Optional
+
+# 每个节点以32字节摘要定长存储
+NODE_SIZE = 32
+
+# 并行构建时每个子树至少包含的叶子数，过小的任务进程间通信开销高于计算量
+MIN_SUBTREE_LEAVES = 1 << 12
+
+# 父节点的哈希输入：二进制模式为 left||right，否则为两者十六进制串的拼接
+def node_message(left: bytes, right: bytes, binary: bool) -> bytes:
+    if binary:
+        return left + right
+    return left.hex().encode() + right.hex().encode()
+
+# 每次交给 sm3_digest_batch 的最大节点数：批量接口会为每条消息建立临时对象，
+# 分片计算可将构建时的峰值内存限制在与分片大小成正比的范围内，而不是与整层成正比
+HASH_SLICE = 1 << 14
+
+# 批量计算叶子哈希，分片写入预先分配的连续缓冲区
+def hash_leaves(leaves: List[bytes]) -> bytearray:
+    out = bytearray(len(leaves) * NODE_SIZE)
+    for start in range(0, len(leaves), HASH_SLICE):
+        digests = b''.join(sm3_digest_batch(leaves[start:start + HASH_SLICE]))
+        out[start * NODE_SIZE:start * NODE_SIZE + len(digests)] = digests
+    return out
+
+# 计算一整层的父节点：level 为连续存放的节点缓冲区，返回上一层的缓冲区
+def hash_level(level: bytearray, binary: bool) -> bytearray:
+    count = len(level) // NODE_SIZE
+    parents = (count + 1) // 2
+    out = bytearray(parents * NODE_SIZE)
+    view = memoryview(level)
+    for first in range(0, parents, HASH_SLICE):
+        last = min(first + HASH_SLICE, parents)
+        # 相邻两个节点在缓冲区中本就连续，直接切片作为 left||right；
+        # 如果节点个数为奇数，最后一个节点与自身组合
+        pairs = [view[2*i*NODE_SIZE:(2*i+2)*NODE_SIZE] for i in range(first, min(last, count // 2))]
+        if last > count // 2:
+            pairs.append(bytes(view[-NODE_SIZE:]) * 2)
+        if not binary:
+            pairs = [binascii.hexlify(pair) for pair in pairs]
+        # 每片交给SM3后端批量计算（numpy后端为多通道并行）
+        out[first * NODE_SIZE:last * NODE_SIZE] = b''.join(sm3_digest_batch(pairs))
+    view.release()
+    return out
+
+# 构建一棵子树的下面 height 层（在工作进程中执行）
+# 子树起点按 2^height 对齐，因此子树内的两两组合与整棵树一致；
+# 最后一棵不满的子树即使已缩成一个节点也要继续与自身组合，保持与整棵树相同的层数
+def build_subtree(leaves: List[bytes], binary: bool, height: int) -> List[bytearray]:
+    levels = [hash_leaves(leaves)]
+    for _ in range(height):
+        levels.append(hash_level(levels[-1], binary))
+    return levels
 
 class MerkleTree:
     # 初始化Merkle树，leaves 表示叶子节点数据列表
-    def __init__(self, leaves: List[bytes]):
-        self.leaves = leaves
-        self.leaf_hashes = [sm3_hash_optimized(leaf) for leaf in leaves]
+    # 每层节点存放在一个连续的 bytearray 中（第 i 个节点位于 [32*i, 32*i+32)），
+    # 只在对外接口（root、证明路径）处转换为十六进制字符串
+    # binary=False 时父节点对两个子节点的十六进制串拼接（128字节）做哈希，与早期实现的根节点一致；
+    # binary=True 时父节点对64字节的 left||right 做哈希，每个父节点少一次压缩
+    # sorted_leaves=True 时叶子在构建时排序一次，树中的位置即有序位置，
+    # 不存在性证明的两个相邻叶子在树中也相邻
+    # workers>1 时在进程池中并行哈希叶子并构建下层子树，主进程只合并顶部几层
+    def __init__(self, leaves: List[bytes], binary: bool = False, sorted_leaves: bool = False,
+                 workers: Optional[int] = None):
+        # 复制一份叶子列表，append/update 不影响调用方的列表
+        self.leaves = sorted(leaves) if sorted_leaves else list(leaves)
+        self.binary = binary
+        self.is_sorted = sorted_leaves
+        self.workers = workers
+        # 非排序模式下按需构建的有序索引：(有序叶子, 对应的树中索引)
+        self._sorted_index = None
         self.tree = self.build_tree()
-        self.root = self.tree[0][0] if self.tree else ""
+        # 叶子层即 tree[0]，不再单独保存一份哈希列表
+        self.leaf_hashes = self.tree[0] if self.tree else bytearray()
+        # 根节点位于最顶层（tree[0]为叶子层）
+        self.root = self.node(len(self.tree) - 1, 0).hex() if self.tree else ""
+
+    # 叶子哈希：返回32字节摘要
+    def hash_leaf(self, leaf: bytes) -> bytes:
+        return sm3_digest(leaf)
+
+    # 父节点的哈希输入：二进制模式为 left||right，否则为两者十六进制串的拼接
+    def node_message(self, left: bytes, right: bytes) -> bytes:
+        return node_message(left, right, self.binary)
+
+    # 父节点哈希：SM3(left || right)
+    def hash_node(self, left: bytes, right: bytes) -> bytes:
+        return sm3_digest(self.node_message(left, right))
+
+    # 计算一整层的父节点：level 为连续存放的节点缓冲区，返回上一层的缓冲区
+    def hash_level(self, level: bytearray) -> bytearray:
+        return hash_level(level, self.binary)
+
+    # 读取第 level 层第 index 个节点
+    def node(self, level: int, index: int) -> bytes:
+        return bytes(self.tree[level][index*NODE_SIZE:(index+1)*NODE_SIZE])
+
+    # 第 level 层的节点个数
+    def level_size(self, level: int) -> int:
+        return len(self.tree[level]) // NODE_SIZE
     
     # 构建Merkle树
-    def build_tree(self) -> List[List[str]]:
-        if not self.leaf_hashes:
+    def build_tree(self) -> List[bytearray]:
+        if not self.leaves:
             return []
             
         # 树的每一层，从叶子开始
-        tree = [self.leaf_hashes.copy()]
+        if self.workers and self.workers > 1 and len(self.leaves) > MIN_SUBTREE_LEAVES:
+            tree = self.build_subtrees_parallel()
+        else:
+            tree = [hash_leaves(self.leaves)]
         
         # 构建上层节点直到根节点
-        while len(tree[-1]) > 1:
-            current_level = tree[-1]
-            next_level = []
-            
-            # 处理当前层，两两组合计算父节点
-            for i in range(0, len(current_level), 2):
-                left = current_level[i]
-                # 如果是最后一个节点且为奇数，与自身组合
-                right = current_level[i+1] if i+1 < len(current_level) else left
-                # 父节点哈希：SM3(left || right)
-                parent = sm3_hash_optimized(left.encode() + right.encode())
-                next_level.append(parent)
-            
-            tree.append(next_level)
+        while len(tree[-1]) > NODE_SIZE:
+            tree.append(self.hash_level(tree[-1]))
         
         return tree
     
+    # 并行构建下层：叶子按 2^height 切分成多棵子树，每棵子树的叶子哈希与下面 height 层在工作进程中完成，
+    # 主进程按层拼接各子树的缓冲区
+    def build_subtrees_parallel(self) -> List[bytearray]:
+        # 子树数量约为进程数的4倍以均衡负载，子树叶子数取2的幂
+        subtree_size = MIN_SUBTREE_LEAVES
+        while subtree_size * self.workers * 4 < len(self.leaves):
+            subtree_size *= 2
+        height = subtree_size.bit_length() - 1
+        chunks = [self.leaves[i:i+subtree_size] for i in range(0, len(self.leaves), subtree_size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            subtrees = list(pool.map(build_subtree, chunks, [self.binary] * len(chunks), [height] * len(chunks)))
+        return [bytearray().join(subtree[level] for subtree in subtrees) for level in range(height + 1)]
+    
+    # 叶子 [start, end) 发生变化后，逐层只重算受影响的父节点
+    # 每层变化区间的右端就是树的右边缘，追加叶子时只需沿右边缘向上，复杂度 O(log n)
+    def rehash(self, start: int, end: int):
+        level = 0
+        while self.level_size(level) > 1:
+            # 区间扩展到成对的边界；奇数层最后一个节点由 hash_level 与自身组合
+            start &= ~1
+            end = min(end + (end & 1), self.level_size(level))
+            parents = self.hash_level(self.tree[level][start*NODE_SIZE:end*NODE_SIZE])
+            level += 1
+            if level == len(self.tree):
+                self.tree.append(bytearray())
+            start //= 2
+            end = start + len(parents) // NODE_SIZE
+            # 覆盖已有节点，超出当前层末尾的部分直接追加
+            self.tree[level][start*NODE_SIZE:end*NODE_SIZE] = parents
+        self.leaf_hashes = self.tree[0]
+        self.root = self.node(len(self.tree) - 1, 0).hex()
+    
+    # 追加一个叶子
+    def append(self, leaf: bytes):
+        self.extend([leaf])
+    
+    # 批量追加叶子：新叶子一次批量哈希，上层只重算右边缘
+    def extend(self, leaves: Iterable[bytes]):
+        # 先物化为列表：下面要遍历多次，迭代器只能消费一次
+        leaves = list(leaves)
+        if not leaves:
+            return
+        if self.is_sorted:
+            # 排序模式只允许按序追加
+            previous = self.leaves[-1:] + leaves
+            if any(previous[i] > previous[i+1] for i in range(len(previous) - 1)):
+                raise ValueError("排序模式下追加的叶子必须不小于已有叶子且自身有序")
+        self._sorted_index = None
+        start = len(self.leaves)
+        self.leaves.extend(leaves)
+        if not self.tree:
+            self.tree.append(bytearray())
+        self.tree[0] += hash_leaves(leaves)
+        self.rehash(start, len(self.leaves))
+    
+    # 修改指定索引的叶子，只重算其到根节点的路径
+    def update(self, index: int, leaf: bytes):
+        if index < 0 or index >= len(self.leaves):
+            raise IndexError("叶子索引越界: {}".format(index))
+        if self.is_sorted and ((index > 0 and self.leaves[index-1] > leaf) or
+                               (index + 1 < len(self.leaves) and leaf > self.leaves[index+1])):
+            raise ValueError("排序模式下修改后的叶子必须保持有序")
+        self._sorted_index = None
+        self.leaves[index] = leaf
+        self.tree[0][index*NODE_SIZE:(index+1)*NODE_SIZE] = self.hash_leaf(leaf)
+        self.rehash(index, index + 1)
+    
     # 获取指定索引叶节点的存在性证明，返回证明路径
     def get_proof(self, index: int) -> List[Tuple[str, bool]]:
-        if index < 0 or index >= len(self.leaves):
+        if not self.tree or index < 0 or index >= self.level_size(0):
             return []
             
         proof = []
@@ -46,65 +205,127 @@ class MerkleTree:
         
         # 从叶子层向上构建证明路径
         for level in range(len(self.tree) - 1):
-            current_level = self.tree[level]
             is_left = (current_index % 2 == 0)
-            sibling_index = current_index - 1 if is_left else current_index + 1
+            sibling_index = current_index + 1 if is_left else current_index - 1
             
             # 如果是最后一个节点且为奇数，兄弟节点是自身
-            if sibling_index >= len(current_level):
+            if sibling_index >= self.level_size(level):
                 sibling_index = current_index
             
-            proof.append((current_level[sibling_index], not is_left))
+            proof.append((self.node(level, sibling_index).hex(), not is_left))
             current_index = current_index // 2
         
         return proof
     
     # 验证存在性证明
     def verify_proof(self, leaf: bytes, index: int, proof: List[Tuple[str, bool]], root: str) -> bool:
-        current_hash = sm3_hash_optimized(leaf)
+        current_hash = self.hash_leaf(leaf)
         
         for hash_val, is_left in proof:
+            sibling = bytes.fromhex(hash_val)
             if is_left:
                 # 兄弟节点在左，当前节点在右
-                current_hash = sm3_hash_optimized(hash_val.encode() + current_hash.encode())
+                current_hash = self.hash_node(sibling, current_hash)
             else:
                 # 兄弟节点在右，当前节点在左
-                current_hash = sm3_hash_optimized(current_hash.encode() + hash_val.encode())
+                current_hash = self.hash_node(current_hash, sibling)
         
-        return current_hash == root
+        return current_hash.hex() == root
+    
+    # 获取多个叶子的联合证明：只包含验证所需的最少兄弟节点
+    # 逐层按索引升序，若某节点的兄弟节点既不在已知集合中、也不是奇数层末尾的自身，则加入证明
+    def get_multiproof(self, indices: List[int]) -> List[str]:
+        if any(index < 0 or index >= (self.level_size(0) if self.tree else 0) for index in indices):
+            raise IndexError("叶子索引越界")
+        known = sorted(set(indices))
+        proof = []
+        for level in range(len(self.tree) - 1):
+            size = self.level_size(level)
+            known_set = set(known)
+            parents = []
+            for index in known:
+                sibling = index ^ 1
+                if sibling < size and sibling not in known_set:
+                    proof.append(self.node(level, sibling).hex())
+                if not parents or parents[-1] != index // 2:
+                    parents.append(index // 2)
+            known = parents
+        return proof
+    
+    # 验证联合证明：items 为 (叶子索引, 叶子数据) 列表，num_leaves 为树的叶子总数
+    # 每个内部节点只计算一次，且每层的父节点一次批量哈希
+    def verify_multiproof(self, items: List[Tuple[int, bytes]], proof: List[str], num_leaves: int, root: str) -> bool:
+        if not items or any(index < 0 or index >= num_leaves for index, _ in items):
+            return False
+        nodes = dict(zip((index for index, _ in items), sm3_digest_batch([leaf for _, leaf in items])))
+        if len(nodes) != len(items):
+            return False  # 重复的索引
+        siblings = iter(proof)
+        size = num_leaves
+        try:
+            while size > 1:
+                positions = []
+                messages = []
+                for index in sorted(nodes):
+                    if positions and positions[-1] == index // 2:
+                        continue  # 与左兄弟一起已经处理
+                    sibling = index ^ 1
+                    if sibling >= size:
+                        sibling_hash = nodes[index]  # 奇数层末尾节点与自身组合
+                    elif sibling in nodes:
+                        sibling_hash = nodes[sibling]
+                    else:
+                        sibling_hash = bytes.fromhex(next(siblings))
+                    left, right = (nodes[index], sibling_hash) if index % 2 == 0 else (sibling_hash, nodes[index])
+                    positions.append(index // 2)
+                    messages.append(self.node_message(left, right))
+                nodes = dict(zip(positions, sm3_digest_batch(messages)))
+                size = (size + 1) // 2
+        except StopIteration:
+            return False  # 证明中的节点不足
+        # 证明中的节点必须恰好用完
+        return next(siblings, None) is None and nodes[0].hex() == root
+    
+    # 有序索引：返回 (有序叶子, 树中索引)，排序模式下第二项为None（有序位置即树中索引）
+    # 非排序模式下只在首次查询时排序一次，之后的查询共用，叶子变化时失效
+    def sorted_index(self) -> Tuple[List[bytes], Optional[List[int]]]:
+        if self.is_sorted:
+            return self.leaves, None
+        if self._sorted_index is None:
+            order = sorted(range(len(self.leaves)), key=self.leaves.__getitem__)
+            self._sorted_index = ([self.leaves[i] for i in order], order)
+        return self._sorted_index
     
     # 获取不存在证明
     def get_non_existence_proof(self, value: bytes) -> Tuple[Optional[bytes], Optional[bytes], List[Tuple[str, bool]], List[Tuple[str, bool]]]:
-        # 对叶子进行排序（假设叶子可排序）
-        sorted_leaves = sorted(self.leaves)
+        return self.get_non_existence_proofs([value])[0]
+    
+    # 批量获取不存在证明：共用同一个有序索引，每个查询用 bisect 在 O(log n) 内找到相邻叶子
+    def get_non_existence_proofs(self, values: List[bytes]) -> list:
+        sorted_leaves, order = self.sorted_index()
         n = len(sorted_leaves)
+        proofs = {}  # 相邻叶子的证明在同一批查询中只生成一次
         
-        # 二分查找确定位置
-        left = 0
-        right = n - 1
-        pos = 0
-        
-        while left <= right:
-            mid = (left + right) // 2
-            if sorted_leaves[mid] < value:
-                pos = mid + 1
-                left = mid + 1
-            else:
-                right = mid - 1
-        
-        # 检查是否存在
-        if pos < n and sorted_leaves[pos] == value:
-            return (None, None, [], [])  # 该值存在
-        
-        # 获取左、右相邻叶子
-        left_leaf = sorted_leaves[pos-1] if pos > 0 else None
-        right_leaf = sorted_leaves[pos] if pos < n else None
+        def proof_at(pos: int) -> List[Tuple[str, bool]]:
+            index = pos if order is None else order[pos]
+            if index not in proofs:
+                proofs[index] = self.get_proof(index)
+            return proofs[index]
         
-        # 获取相邻叶子的存在性证明
-        left_proof = self.get_proof(sorted_leaves.index(left_leaf)) if left_leaf is not None else []
-        right_proof = self.get_proof(sorted_leaves.index(right_leaf)) if right_leaf is not None else []
-        
-        return (left_leaf, right_leaf, left_proof, right_proof)
+        results = []
+        for value in values:
+            pos = bisect.bisect_left(sorted_leaves, value)
+            # 检查是否存在
+            if pos < n and sorted_leaves[pos] == value:
+                results.append((None, None, [], []))  # 该值存在
+                continue
+            # 获取左、右相邻叶子及其存在性证明
+            left_leaf = sorted_leaves[pos-1] if pos > 0 else None
+            right_leaf = sorted_leaves[pos] if pos < n else None
+            left_proof = proof_at(pos - 1) if left_leaf is not None else []
+            right_proof = proof_at(pos) if right_leaf is not None else []
+            results.append((left_leaf, right_leaf, left_proof, right_proof))
+        return results
 
 # 测试函数：生成10万个叶子节点并构建Merkle树
 def test_merkle_tree():
@@ -146,5 +367,335 @@ def test_merkle_tree():
     else:
         print("不存在性证明验证失败")
 
+# 测试联合证明：与逐个证明相比节点更少，且篡改叶子后验证失败
+def test_multiproof():
+    for binary in (False, True):
+        for num_leaves in (1, 2, 7, 100):
+            leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+            merkle_tree = MerkleTree(leaves, binary=binary)
+            for indices in ([0], [num_leaves - 1], list(range(0, num_leaves, 3)), list(range(num_leaves))):
+                proof = merkle_tree.get_multiproof(indices)
+                items = [(i, leaves[i]) for i in indices]
+                assert merkle_tree.verify_multiproof(items, proof, num_leaves, merkle_tree.root)
+                assert len(proof) <= sum(len(merkle_tree.get_proof(i)) for i in indices)
+                tampered = [(i, b"tampered") if k == 0 else (i, leaf) for k, (i, leaf) in enumerate(items)]
+                assert not merkle_tree.verify_multiproof(tampered, proof, num_leaves, merkle_tree.root)
+                if proof:
+                    assert not merkle_tree.verify_multiproof(items, proof[:-1], num_leaves, merkle_tree.root)
+    print("联合证明测试通过")
+
+# 测试增量更新：append/extend/update 之后的根节点与证明应与整体重建完全一致
+def test_incremental_update():
+    for binary in (False, True):
+        leaves = [f"leaf_{i}".encode() for i in range(5)]
+        merkle_tree = MerkleTree(leaves[:1], binary=binary)
+        for leaf in leaves[1:]:
+            merkle_tree.append(leaf)
+        more = [f"leaf_{i}".encode() for i in range(5, 40)]
+        merkle_tree.extend(more[:3])
+        merkle_tree.extend(leaf for leaf in more[3:])  # 迭代器与列表结果一致
+        leaves += more
+        leaves[7] = b"changed_7"
+        merkle_tree.update(7, leaves[7])
+        leaves[39] = b"changed_39"
+        merkle_tree.update(39, leaves[39])
+        
+        rebuilt = MerkleTree(leaves, binary=binary)
+        assert merkle_tree.root == rebuilt.root
+        assert merkle_tree.tree == rebuilt.tree
+        assert all(merkle_tree.get_proof(i) == rebuilt.get_proof(i) for i in range(len(leaves)))
+    
+    empty = MerkleTree([])
+    empty.append(b"leaf_0")
+    assert empty.root == MerkleTree([b"leaf_0"]).root
+    print("增量更新测试通过")
+
+def test_non_existence_proofs():
+    leaves = [f"leaf_{i:03d}".encode() for i in range(0, 60, 3)]
+    shuffled = leaves[1::2] + leaves[::2]
+    queries = [b"leaf_", b"leaf_004", b"leaf_030", b"leaf_031", b"leaf_999"]
+    for sorted_leaves in (False, True):
+        merkle_tree = MerkleTree(shuffled, sorted_leaves=sorted_leaves)
+        assert merkle_tree.root == MerkleTree(leaves if sorted_leaves else shuffled).root
+        proofs = merkle_tree.get_non_existence_proofs(queries)
+        assert proofs == [merkle_tree.get_non_existence_proof(q) for q in queries]
+        for value, (left, right, left_proof, right_proof) in zip(queries, proofs):
+            if value in leaves:
+                assert (left, right, left_proof, right_proof) == (None, None, [], [])
+                continue
+            assert left == max((x for x in leaves if x < value), default=None)
+            assert right == min((x for x in leaves if x > value), default=None)
+            for leaf, proof in ((left, left_proof), (right, right_proof)):
+                if leaf is not None:
+                    index = merkle_tree.leaves.index(leaf)
+                    assert merkle_tree.verify_proof(leaf, index, proof, merkle_tree.root)
+            if sorted_leaves and left is not None and right is not None:
+                # 排序模式下两个相邻叶子在树中也相邻
+                assert merkle_tree.leaves.index(right) == merkle_tree.leaves.index(left) + 1
+        
+        # 有序索引在多次查询间共用，叶子变化后失效并重建
+        ordered, order = merkle_tree.sorted_index()
+        assert merkle_tree.sorted_index()[0] is ordered
+        assert (order is None) == sorted_leaves
+        merkle_tree.append(b"leaf_999")
+        assert merkle_tree.get_non_existence_proof(b"leaf_999")[:2] == (None, None)
+        assert merkle_tree.get_non_existence_proof(b"leaf_998")[:2] == (b"leaf_057", b"leaf_999")
+        merkle_tree.update(len(merkle_tree.leaves) - 1, b"leaf_9999")
+        assert merkle_tree.get_non_existence_proof(b"leaf_999")[:2] == (b"leaf_057", b"leaf_9999")
+        
+        if sorted_leaves:
+            # 排序模式拒绝破坏顺序的追加与修改，且树不被改动
+            root = merkle_tree.root
+            for bad in (lambda: merkle_tree.extend([b"leaf_99999", b"leaf_000"]),
+                        lambda: merkle_tree.append(b"leaf_000"),
+                        lambda: merkle_tree.update(0, b"leaf_999"),
+                        lambda: merkle_tree.update(5, b"leaf_000")):
+                try:
+                    bad()
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("排序模式应当拒绝乱序的叶子")
+            assert merkle_tree.root == root and merkle_tree.leaves == sorted(merkle_tree.leaves)
+    print("不存在性证明测试通过")
+
+# 内存对比：连续缓冲区存储 vs 早期每层一个十六进制字符串列表的存储方式，
+# 以及构建过程中的峰值内存（不含叶子数据本身）
+def benchmark_memory(num_leaves: int = 100000):
+    import sys
+    import tracemalloc
+    leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+    MerkleTree(leaves[:HASH_SLICE])  # 预先加载SM3后端，避免把导入计入峰值
+
+    build_peaks = {}
+    for binary in (False, True):
+        tracemalloc.start()
+        merkle_tree = MerkleTree(leaves, binary=binary)
+        build_peaks[binary] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # 早期布局：List[List[str]]，每个节点一个64字符的str对象
+    tracemalloc.start()
+    old_layout = [[merkle_tree.node(level, i).hex() for i in range(merkle_tree.level_size(level))]
+                  for level in range(len(merkle_tree.tree))]
+    old_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del old_layout
+    
+    new_bytes = sum(sys.getsizeof(level) for level in merkle_tree.tree)
+    print(f"{num_leaves}个叶子节点的树结构内存占用:")
+    print(f"  十六进制字符串列表: {old_bytes / (1 << 20):8.2f} MiB")
+    print(f"  连续缓冲区:         {new_bytes / (1 << 20):8.2f} MiB ({old_bytes / new_bytes:.1f}倍)")
+    print(f"  构建峰值（十六进制拼接模式）: {build_peaks[False] / (1 << 20):8.2f} MiB")
+    print(f"  构建峰值（二进制模式）:       {build_peaks[True] / (1 << 20):8.2f} MiB")
+
+# 流式计算根节点：逐块读取叶子，只保留每层一个待合并的子树根（栈），内存与叶子总数无关
+# 结果与 MerkleTree(...).root 完全一致，包括奇数层末尾节点与自身组合的规则
+# chunk_size 必须是2的幂：每块叶子批量哈希并构建成一棵对齐的子树后再入栈
+def merkle_root(leaves: Iterable[bytes], binary: bool = False, chunk_size: int = 1 << 12) -> str:
+    if chunk_size <= 0 or chunk_size & (chunk_size - 1):
+        raise ValueError("chunk_size必须是2的幂，而不是{}".format(chunk_size))
+    height = chunk_size.bit_length() - 1
+    stack = []  # (子树高度, 子树根)，自底向上高度严格递减
+    leaves = iter(leaves)
+    chunk = list(itertools.islice(leaves, chunk_size))
+    while chunk:
+        next_chunk = list(itertools.islice(leaves, chunk_size))
+        if not stack and not next_chunk:
+            # 叶子总数不超过一块：与 MerkleTree 相同，组合到只剩一个节点为止
+            level = hash_leaves(chunk)
+            while len(level) > NODE_SIZE:
+                level = hash_level(level, binary)
+            return bytes(level).hex()
+        # 最后一块不满时 build_subtree 仍组合到 height 层，与整棵树的自身组合规则一致
+        node = bytes(build_subtree(chunk, binary, height)[-1])
+        node_height = height
+        while stack and stack[-1][0] == node_height:
+            node = sm3_digest(node_message(stack.pop()[1], node, binary))
+            node_height += 1
+        stack.append((node_height, node))
+        chunk = next_chunk
+    if not stack:
+        return ""
+    
+    # 收尾：栈顶是其所在层的最后一个节点，该层节点数为奇数时与自身组合，直到与下一个子树同高再合并
+    node_height, node = stack.pop()
+    while stack:
+        if stack[-1][0] == node_height:
+            node = sm3_digest(node_message(stack.pop()[1], node, binary))
+        else:
+            node = sm3_digest(node_message(node, node, binary))
+        node_height += 1
+    return node.hex()
+
+# 测试流式根节点计算：各种叶子数与分块大小下与整体构建的根节点一致
+def test_merkle_root():
+    for binary in (False, True):
+        for num_leaves in list(range(0, 40)) + [100, 257, 1000]:
+            leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+            root = MerkleTree(leaves, binary=binary).root
+            for chunk_size in (1, 2, 4, 16, 4096):
+                assert merkle_root(iter(leaves), binary, chunk_size) == root, (binary, num_leaves, chunk_size)
+    print("流式根节点计算测试通过")
+
+# 磁盘文件格式：文件头 || 各层起始偏移 || 各层定长32字节节点
+#   文件头: 魔数(8) 版本(4) 标志位(4, bit0=binary) 叶子数(8) 层数(8)，小端序
+#   偏移表: 每层一个8字节小端整数，为该层第一个节点在文件中的偏移
+FILE_MAGIC = b'SM3MRKL\x00'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sIIQQ')
+
+# 将树的全部节点写入文件，供 MerkleTreeFile 直接映射使用
+def save_tree(merkle_tree: MerkleTree, path: str):
+    levels = merkle_tree.tree
+    offset = FILE_HEADER.size + 8 * len(levels)
+    offsets = []
+    for level in levels:
+        offsets.append(offset)
+        offset += len(level)
+    with open(path, 'wb') as f:
+        f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, int(merkle_tree.binary),
+                                 merkle_tree.level_size(0) if levels else 0, len(levels)))
+        f.write(struct.pack(f'<{len(levels)}Q', *offsets))
+        for level in levels:
+            f.write(level)
+
+# 只读的磁盘Merkle树：mmap 映射文件，每层是文件映射上的 memoryview，启动时不重建也不读取节点，
+# root / get_proof / get_multiproof 只读取 O(log n) 个节点，多个进程共享操作系统页缓存
+class MerkleTreeFile(MerkleTree):
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mmap = None
+        self.tree = []
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._load(path)
+        except (ValueError, struct.error) as e:
+            # 空文件、被截断或头部损坏的文件一律视为无效，并释放已打开的映射与文件
+            self.close()
+            raise ValueError("不是有效的Merkle树文件: {} ({})".format(path, e)) from None
+        self.binary = bool(self._flags & 1)
+        self.is_sorted = False
+        self.workers = None
+        self._sorted_index = None
+        self.leaves = None  # 文件中不保存叶子数据
+        self.leaf_hashes = self.tree[0] if self.tree else bytearray()
+        self.root = self.node(len(self.tree) - 1, 0).hex() if self.tree else ""
+
+    # 解析文件头与各层偏移，并检查层数与叶子数一致、每层都完整地位于文件之内
+    def _load(self, path: str):
+        magic, version, self._flags, num_leaves, num_levels = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("文件头不匹配")
+        sizes = []
+        size = num_leaves
+        while size:
+            sizes.append(size)
+            if size == 1:
+                break
+            size = (size + 1) // 2
+        if num_levels != len(sizes):
+            raise ValueError("{}个叶子应有{}层，文件中为{}层".format(num_leaves, len(sizes), num_levels))
+        data_start = FILE_HEADER.size + 8 * num_levels
+        offsets = struct.unpack_from(f'<{num_levels}Q', self._mmap, FILE_HEADER.size)
+        for offset, size in zip(offsets, sizes):
+            if offset < data_start or offset + size * NODE_SIZE > len(self._mmap):
+                raise ValueError("第{}层超出文件范围".format(len(self.tree)))
+            self.tree.append(memoryview(self._mmap)[offset:offset + size * NODE_SIZE])
+        self.num_leaves = num_leaves
+
+    # 文件中没有叶子数据，也不允许修改
+    def sorted_index(self) -> Tuple[List[bytes], Optional[List[int]]]:
+        raise TypeError("MerkleTreeFile不保存叶子数据，没有有序索引")
+
+    def get_non_existence_proofs(self, values: List[bytes]) -> list:
+        raise TypeError("MerkleTreeFile不保存叶子数据，无法生成不存在性证明")
+    
+    def extend(self, leaves: List[bytes]):
+        raise TypeError("MerkleTreeFile是只读的")
+    
+    def update(self, index: int, leaf: bytes):
+        raise TypeError("MerkleTreeFile是只读的")
+    
+    def close(self):
+        for level in self.tree:
+            level.release()
+        self.tree = []
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+# 测试磁盘文件：映射后的根节点与证明与内存中的树一致
+def test_tree_file(path: str = "merkle_tree_test.bin"):
+    for num_leaves in (0, 1, 7, 1000):
+        leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+        for binary in (False, True):
+            merkle_tree = MerkleTree(leaves, binary=binary)
+            save_tree(merkle_tree, path)
+            with MerkleTreeFile(path) as tree_file:
+                assert tree_file.root == merkle_tree.root
+                assert tree_file.binary == binary
+                for i in range(0, num_leaves, 97):
+                    proof = tree_file.get_proof(i)
+                    assert proof == merkle_tree.get_proof(i)
+                    assert tree_file.verify_proof(leaves[i], i, proof, tree_file.root)
+                assert tree_file.get_multiproof(list(range(num_leaves))) == merkle_tree.get_multiproof(list(range(num_leaves)))
+
+    # 截断、过短或为空的文件都应抛出 ValueError
+    with open(path, 'rb') as f:
+        data = f.read()
+    for broken in (data[:-100], data[:FILE_HEADER.size - 1], b''):
+        with open(path, 'wb') as f:
+            f.write(broken)
+        try:
+            MerkleTreeFile(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("损坏的文件应当被拒绝")
+    os.remove(path)
+    print("磁盘文件测试通过")
+
+# 并行构建的扩展性测试：1 到 N 个进程构建同一棵树，根节点必须一致
+# 并行构建与串行构建逐层一致：叶子数略多于 MIN_SUBTREE_LEAVES 的整数倍，最后一棵子树不满
+def test_parallel_build():
+    for num_leaves in (2 * MIN_SUBTREE_LEAVES + 5, 3 * MIN_SUBTREE_LEAVES + 1):
+        leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+        for binary in (False, True):
+            serial = MerkleTree(leaves, binary=binary)
+            parallel = MerkleTree(leaves, binary=binary, workers=2)
+            assert len(parallel.tree) == len(serial.tree)
+            assert all(a == b for a, b in zip(parallel.tree, serial.tree))
+            assert parallel.root == serial.root
+    print("并行构建测试通过")
+
+def benchmark_parallel_build(num_leaves: int = 1000000, max_workers: Optional[int] = None):
+    max_workers = max_workers or os.cpu_count() or 1
+    leaves = [f"leaf_{i}".encode() for i in range(num_leaves)]
+    print(f"{num_leaves}个叶子节点的并行构建（CPU核数 {os.cpu_count()}）:")
+    root = None
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        merkle_tree = MerkleTree(leaves, binary=True, workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        assert root is None or merkle_tree.root == root
+        root = merkle_tree.root
+        print(f"  {workers:>3} 进程: {elapsed:8.2f}s  加速比 {baseline / elapsed:5.2f}")
+
 if __name__ == "__main__":
     test_merkle_tree()
+    test_incremental_update()
+    test_non_existence_proofs()
+    test_multiproof()
+    test_tree_file()
+    test_merkle_root()
+    test_parallel_build()
+    benchmark_memory()
@@ -1,4 +1,5 @@
-import sys
+import importlib.util
+import os
 import struct
 from typing import List, Tuple, Union
 
@@ -37,22 +38,18 @@ def p1(x: int) -> int:
     """置换函数P1"""
     return x ^ rotl(x, 15) ^ rotl(x, 23)
 
+def padding_suffix(length: int) -> bytes:
+    """按消息字节长度生成填充后缀：0x80 || 0x00... || 64bit长度"""
+    return b'\x80' + b'\x00' * ((55 - length) % 64) + struct.pack('>Q', (length * 8) & 0xFFFFFFFFFFFFFFFF)
+
 def padding(message: bytes) -> bytes:
     """消息填充"""
-    length = len(message) * 8  # 消息长度(bit)
-    message += b'\x80'  # 填充10000000
-    
-    # 填充0直到满足长度 ≡ 448 mod 512
-    while (len(message) * 8) % 512 != 448:
-        message += b'\x00'
-    
-    # 附加64bit长度信息
-    message += struct.pack('>Q', length)
-    return message
+    # 一次性拼接填充后缀，使长度 ≡ 448 mod 512 并附加64bit长度信息
+    return bytes(message) + padding_suffix(len(message))
 
 def message_extension(B):
-    # 确保B是bytes类型
-    if not isinstance(B, bytes):
+    # 确保B是bytes类对象（bytes/bytearray/memoryview均可，避免额外拷贝）
+    if not isinstance(B, (bytes, bytearray, memoryview)):
         raise TypeError("message_extension需要bytes类型的参数，而不是{}".format(type(B)))
     
     W = list(struct.unpack('>16I', B))  # 将512bit分组转换为16个32bit字
@@ -70,7 +67,7 @@ def compress_function(V, B):
     if isinstance(B, int):
         # 假设B是一个512位的整数，将其转换为bytes
         B = B.to_bytes(64, byteorder='big')
-    elif not isinstance(B, bytes):
+    elif not isinstance(B, (bytes, bytearray, memoryview)):
         raise TypeError("compress_function的B参数需要是bytes或int类型，而不是{}".format(type(B)))
     
     W, W_prime = message_extension(B)
@@ -80,8 +77,8 @@ def compress_function(V, B):
         # 64轮迭代压缩
         SS1 = rotl((rotl(A, 12) + E + rotl(T[j], j % 32)) % 0x100000000, 7)
         SS2 = SS1 ^ rotl(A, 12)
-        TT1 = (ff_j(j, A, B, C) + D + SS2 + W_prime[j]) % 0x100000000
-        TT2 = (gg_j(j, E, F, G) + H + SS1 + W[j]) % 0x100000000
+        TT1 = (ff_j(A, B, C, j) + D + SS2 + W_prime[j]) % 0x100000000
+        TT2 = (gg_j(E, F, G, j) + H + SS1 + W[j]) % 0x100000000
         D = C
         C = rotl(B, 9)
         B = A
@@ -103,50 +100,398 @@ def compress_function(V, B):
     ]
     
     
+# 预先循环左移的轮常量：T_ROT[j] = T[j] <<< (j mod 32)
+T_ROT = [rotl(T[j], j % 32) for j in range(64)]
+
+def compress_function_fast(V, B):
+    """压缩函数快速路径：轮常量预计算，0-15轮与16-63轮分开并内联布尔函数
+
+    中间结果只在必要处截断为32位；W'_j在轮函数中按需计算，不单独构造列表。
+    结果与compress_function完全一致。
+    """
+    M = 0xFFFFFFFF
+    Tr = T_ROT
+    W = list(struct.unpack('>16I', B))
+    append = W.append
+    # 消息扩展：P1与循环左移的截断合并为一次
+    for j in range(16, 68):
+        x = W[j-16] ^ W[j-9]
+        y = W[j-3]
+        x = (x ^ (y << 15) ^ (y >> 17)) & M
+        x = (x ^ (x << 15) ^ (x >> 17) ^ (x << 23) ^ (x >> 9)) & M
+        y = W[j-13]
+        append((x ^ ((y << 7) | (y >> 25)) ^ W[j-6]) & M)
+
+    A, B, C, D, E, F, G, H = V
+    # 0-15轮：FF = GG = x ^ y ^ z
+    for Wj, Wj4, Tj in zip(W[:16], W[4:20], Tr[:16]):
+        a12 = ((A << 12) | (A >> 20)) & M
+        SS1 = (a12 + E + Tj) & M
+        SS1 = ((SS1 << 7) | (SS1 >> 25)) & M
+        TT1 = ((A ^ B ^ C) + D + (SS1 ^ a12) + (Wj ^ Wj4)) & M
+        TT2 = ((E ^ F ^ G) + H + SS1 + Wj) & M
+        D, C, B, A = C, ((B << 9) | (B >> 23)) & M, A, TT1
+        H, G, F, E = G, ((F << 19) | (F >> 13)) & M, E, (TT2 ^ (TT2 << 9) ^ (TT2 >> 23) ^ (TT2 << 17) ^ (TT2 >> 15)) & M
+    # 16-63轮：FF为多数函数，GG为选择函数
+    for Wj, Wj4, Tj in zip(W[16:64], W[20:68], Tr[16:]):
+        a12 = ((A << 12) | (A >> 20)) & M
+        SS1 = (a12 + E + Tj) & M
+        SS1 = ((SS1 << 7) | (SS1 >> 25)) & M
+        TT1 = (((A & B) | (C & (A | B))) + D + (SS1 ^ a12) + (Wj ^ Wj4)) & M
+        TT2 = ((((F ^ G) & E) ^ G) + H + SS1 + Wj) & M
+        D, C, B, A = C, ((B << 9) | (B >> 23)) & M, A, TT1
+        H, G, F, E = G, ((F << 19) | (F >> 13)) & M, E, (TT2 ^ (TT2 << 9) ^ (TT2 >> 23) ^ (TT2 << 17) ^ (TT2 >> 15)) & M
+
+    return [A ^ V[0], B ^ V[1], C ^ V[2], D ^ V[3],
+            E ^ V[4], F ^ V[5], G ^ V[6], H ^ V[7]]
+
+
+class SM3:
+    """流式SM3杂凑对象，接口与hashlib保持一致：update()/digest()/hexdigest()/copy()
+
+    内部只缓存不足一个分组的尾部数据，完整分组直接以memoryview切片送入压缩函数，
+    因此可以分块处理任意大小的输入而不复制整条消息。
+    """
+    name = 'sm3'
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self, data: Union[str, bytes] = b'', initial_vector: List[int] = None, length: int = 0,
+                 backend: str = None):
+        # length为initial_vector已经覆盖的消息字节数，用于从中间状态继续计算
+        if length % 64:
+            raise ValueError("中间状态对应的消息长度必须是64的倍数，而不是{}".format(length))
+        # backend为空时使用全局后端（首次使用时选定）
+        self._compress = get_backend(backend).compress
+        self._V = list(initial_vector) if initial_vector else IV.copy()
+        self._buffer = bytearray()  # 未满64字节的待处理数据
+        self._length = length       # 已输入的消息总字节数
+        if data:
+            self.update(data)
+
+    def update(self, data: Union[str, bytes]) -> None:
+        """追加消息数据，支持bytes/bytearray/memoryview"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        mv = memoryview(data).cast('B')
+        self._length += len(mv)
+        V = self._V
+        compress = self._compress
+
+        # 先补齐上次遗留的不完整分组
+        if self._buffer:
+            need = 64 - len(self._buffer)
+            self._buffer += mv[:need]
+            mv = mv[need:]
+            if len(self._buffer) < 64:
+                return
+            V = compress(V, bytes(self._buffer))
+            self._buffer.clear()
+
+        # 完整分组直接压缩，剩余部分放入缓冲区
+        end = len(mv) - len(mv) % 64
+        for i in range(0, end, 64):
+            V = compress(V, mv[i:i+64])
+        self._buffer += mv[end:]
+        self._V = V
+
+    def copy(self) -> 'SM3':
+        """复制当前中间状态，用于共享前缀后分叉计算"""
+        other = self.__class__.__new__(self.__class__)
+        other._compress = self._compress
+        other._V = self._V.copy()
+        other._buffer = self._buffer.copy()
+        other._length = self._length
+        return other
+
+    def midstate(self) -> Tuple[List[int], int]:
+        """返回(链接变量, 已压缩字节数)，未满一个分组的缓冲数据不包含在内"""
+        return self._V.copy(), self._length - len(self._buffer)
+
+    def digest(self) -> bytes:
+        """返回32字节杂凑值，不影响对象后续继续update"""
+        V = self._V
+        tail = bytes(self._buffer) + padding_suffix(self._length)
+        for i in range(0, len(tail), 64):
+            V = self._compress(V, tail[i:i+64])
+        return struct.pack('>8I', *V)
+
+    def hexdigest(self) -> str:
+        """返回64位十六进制杂凑值"""
+        return self.digest().hex()
+
+
 def sm3_hash(message: Union[str, bytes], initial_vector: List[int] = None) -> str:
-    """计算SM3哈希值，支持自定义初始向量（用于长度扩展攻击）"""
-    if isinstance(message, str):
-        message = message.encode('utf-8')
-    
-    # 初始化向量
-    V = initial_vector.copy() if initial_vector else IV.copy()
-    
-    # 消息填充
-    padded = padding(message)
-    
-    # 按512bit分组处理
-    for i in range(0, len(padded), 64):
-        B = padded[i:i+64]
-        V = compress_function(V, B)
-    
-    # 拼接结果
-    return ''.join(f'{x:08x}' for x in V)
+    """计算SM3哈希值，支持自定义初始向量（用于长度扩展攻击）；固定使用参考实现，用于正确性对照"""
+    return SM3(message, initial_vector, backend='reference').hexdigest()
+
+def sm3_digest(message: Union[str, bytes], initial_vector: List[int] = None) -> bytes:
+    """计算SM3哈希值，返回32字节原始摘要"""
+    return SM3(message, initial_vector).digest()
 
-# 优化版本：使用预计算和循环展开提升性能
+# 优化版本：使用当前后端的快速压缩函数，分组直接从memoryview送入
 def sm3_hash_optimized(message: Union[str, bytes], initial_vector: List[int] = None) -> str:
-    if isinstance(message, str):
-        message = message.encode('utf-8')
-    
-    V = initial_vector.copy() if initial_vector else IV.copy()
-    padded = padding(message)
-    
-    # 循环展开处理分组（每2组处理一次）
-    for i in range(0, len(padded), 128):
-        # 处理第一组
-        if i < len(padded):
-            B = padded[i:i+64]
-            V = compress_function(V, B)
-        
-        # 处理第二组
-        if i + 64 < len(padded):
-            B = padded[i+64:i+128]
-            V = compress_function(V, B)
-    
-    return ''.join(f'{x:08x}' for x in V)
+    return SM3(message, initial_vector).hexdigest()
+
+
+class SM3Prefix:
+    """固定前缀的SM3：前缀中的完整分组只压缩一次并保存链接变量
+
+    之后每条消息都从保存的中间状态继续计算，适用于大量共享同一前缀的消息。
+    """
+
+    def __init__(self, prefix: Union[str, bytes]):
+        self._state = SM3(prefix)
+
+    def new(self, data: Union[str, bytes] = b'') -> SM3:
+        """从前缀的中间状态分叉出新的SM3对象"""
+        h = self._state.copy()
+        if data:
+            h.update(data)
+        return h
+
+    def digest(self, data: Union[str, bytes]) -> bytes:
+        """计算SM3(prefix || data)"""
+        return self.new(data).digest()
+
+    def hexdigest(self, data: Union[str, bytes]) -> str:
+        return self.new(data).hexdigest()
+
+    def extend(self, data: Union[str, bytes]) -> 'SM3Prefix':
+        """返回前缀为 prefix || data 的新对象，不重复压缩已有前缀"""
+        extended = SM3Prefix.__new__(SM3Prefix)
+        extended._state = self.new(data)
+        return extended
+
+
+class HMACSM3:
+    """预编译密钥的HMAC-SM3：ipad/opad分组各压缩一次，之后每次计算只处理消息本身
+
+    对短消息而言每次调用省去两次压缩，约为全部压缩次数的一半。
+    """
+    block_size = 64
+    digest_size = 32
+
+    def __init__(self, key: bytes):
+        if len(key) > 64:
+            key = sm3_digest(key)
+        key = key.ljust(64, b'\x00')
+        self._inner = SM3Prefix(bytes(x ^ 0x36 for x in key))
+        self._outer = SM3Prefix(bytes(x ^ 0x5c for x in key))
+
+    def digest(self, data: Union[str, bytes]) -> bytes:
+        """计算HMAC-SM3(key, data)"""
+        return self._outer.digest(self._inner.digest(data))
+
+    def hexdigest(self, data: Union[str, bytes]) -> str:
+        return self.digest(data).hex()
+
+    def extend(self, prefix: Union[str, bytes]) -> 'HMACSM3':
+        """返回计算 HMAC-SM3(key, prefix || data) 的对象，prefix 中的完整分组只压缩一次"""
+        extended = HMACSM3.__new__(HMACSM3)
+        extended._inner = self._inner.extend(prefix)
+        extended._outer = self._outer
+        return extended
+
+
+def hmac_sm3(key: bytes, data: Union[str, bytes]) -> bytes:
+    """一次性计算HMAC-SM3，同一密钥多次使用时应直接复用HMACSM3对象"""
+    return HMACSM3(key).digest(data)
+
+def compress_function_lanes(V, W16):
+    """多通道压缩函数：对N条消息的同一轮分组做SIMD式并行压缩
+
+    V为(8, N)的uint32数组，W16为(16, N)的uint32消息字；
+    消息扩展与64轮迭代均以整列数组运算完成，uint32加法自动模2^32。
+    """
+    import numpy as np
+
+    def rot(x, n):
+        return (x << n) | (x >> (32 - n))
+
+    W = np.empty((68,) + W16.shape[1:], dtype=np.uint32)
+    W[:16] = W16
+    for j in range(16, 68):
+        x = W[j-16] ^ W[j-9] ^ rot(W[j-3], 15)
+        W[j] = x ^ rot(x, 15) ^ rot(x, 23) ^ rot(W[j-13], 7) ^ W[j-6]
+    W_prime = W[:64] ^ W[4:68]
+
+    A, B, C, D, E, F, G, H = V
+    for j in range(64):
+        a12 = rot(A, 12)
+        SS1 = rot(a12 + E + np.uint32(T_ROT[j]), 7)
+        SS2 = SS1 ^ a12
+        if j < 16:
+            FF = A ^ B ^ C
+            GG = E ^ F ^ G
+        else:
+            FF = (A & B) | (C & (A | B))
+            GG = ((F ^ G) & E) ^ G
+        TT1 = FF + D + SS2 + W_prime[j]
+        TT2 = GG + H + SS1 + W[j]
+        D, C, B, A = C, rot(B, 9), A, TT1
+        H, G, F, E = G, rot(F, 19), E, TT2 ^ rot(TT2, 9) ^ rot(TT2, 17)
+
+    return np.stack([A, B, C, D, E, F, G, H]) ^ V
+
+
+def _digest_batch_numpy(messages: List[Union[str, bytes]], min_lanes: int = 32) -> List[bytes]:
+    """NumPy多通道批量计算32字节摘要；不足min_lanes条的分组改用标量快速路径"""
+    import numpy as np
+
+    # 按填充后的分组数对消息分组
+    groups = {}
+    for idx, message in enumerate(messages):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        groups.setdefault((len(message) + 8) // 64 + 1, []).append((idx, message))
+
+    result = [None] * len(messages)
+    for nblocks, items in groups.items():
+        if len(items) < min_lanes:
+            # 通道太少时数组运算的固定开销高于标量实现
+            for idx, message in items:
+                result[idx] = SM3(message, backend='fast').digest()
+            continue
+        # (N, 16*nblocks) 大端字 -> 转置后每列为一条消息
+        padded = b''.join(padding(m) for _, m in items)
+        words = np.frombuffer(padded, dtype='>u4')
+        words = words.reshape(len(items), 16 * nblocks).T.astype(np.uint32)
+        V = np.repeat(np.array(IV, dtype=np.uint32)[:, None], len(items), axis=1)
+        for b in range(nblocks):
+            V = compress_function_lanes(V, words[16*b:16*b+16])
+        digests = V.T.astype('>u4').tobytes()
+        for k, (idx, _) in enumerate(items):
+            result[idx] = digests[32*k:32*k+32]
+    return result
+
+
+def sm3_hash_batch(messages: List[Union[str, bytes]]) -> List[str]:
+    """批量计算SM3哈希值（NumPy多通道实现），返回顺序与输入一致
+
+    消息按填充后的分组数自动分组，同组内的所有消息按列打包成uint32数组，
+    逐分组以compress_function_lanes同步压缩。适合大量等长短消息（如Merkle树节点）。
+    """
+    return [d.hex() for d in _digest_batch_numpy(messages)]
+
+
+class SM3Backend:
+    """SM3计算后端：单分组压缩函数 + 可选的批量摘要实现"""
+
+    def __init__(self, name: str, compress, digest_batch=None, requires: str = None):
+        self.name = name
+        self.compress = compress
+        self._digest_batch = digest_batch
+        self.requires = requires  # 依赖的可选模块
+
+    def available(self) -> bool:
+        # 只查找模块而不导入：选定后端时不加载numpy，真正批量计算时才导入
+        if self.requires is None:
+            return True
+        return importlib.util.find_spec(self.requires) is not None
+
+    def digest_batch(self, messages: List[Union[str, bytes]]) -> List[bytes]:
+        if self._digest_batch is not None:
+            return self._digest_batch(messages)
+        return [SM3(m, backend=self.name).digest() for m in messages]
+
+
+# 可选后端：纯Python参考实现 / 快速标量内核 / NumPy多通道批量
+BACKENDS = {
+    'reference': SM3Backend('reference', compress_function),
+    'fast': SM3Backend('fast', compress_function_fast),
+    'numpy': SM3Backend('numpy', compress_function_fast, _digest_batch_numpy, requires='numpy'),
+}
+
+_backend = None  # 当前全局后端，首次使用时才选定
+
+
+def set_backend(name: str) -> None:
+    """设置全局SM3后端"""
+    global _backend
+    _backend = get_backend(name)
+
+
+def get_backend(name: str = None) -> SM3Backend:
+    """返回指定名称的后端；name为空时返回全局后端
+
+    全局后端在首次使用时选定：优先环境变量SM3_BACKEND，否则numpy可用时选numpy，再否则选fast。
+    numpy后端的单分组压缩（流式SM3、HMAC）与fast相同，numpy只在digest_batch中才导入。
+    """
+    global _backend
+    if name is None:
+        if _backend is None:
+            name = os.environ.get('SM3_BACKEND')
+            if not name:
+                name = 'numpy' if BACKENDS['numpy'].available() else 'fast'
+            _backend = get_backend(name)
+        return _backend
+    if name not in BACKENDS:
+        raise ValueError("未知的SM3后端: {}，可选: {}".format(name, ', '.join(BACKENDS)))
+    backend = BACKENDS[name]
+    if not backend.available():
+        raise ImportError("SM3后端{}需要安装{}".format(name, backend.requires))
+    return backend
+
+
+def sm3_digest_batch(messages: List[Union[str, bytes]]) -> List[bytes]:
+    """使用当前后端批量计算32字节摘要，返回顺序与输入一致"""
+    return get_backend().digest_batch(messages)
+
+
+# 差分测试：随机输入下快速压缩函数与参考实现结果必须一致
+def test_compress_function(rounds: int = 2000):
+    import random
+    rng = random.Random(0x5333)
+    for _ in range(rounds):
+        V = [rng.getrandbits(32) for _ in range(8)]
+        B = rng.getrandbits(512).to_bytes(64, 'big')
+        assert compress_function_fast(V, B) == compress_function(V, B), (V, B.hex())
+    for length in list(range(0, 200)) + [1000, 4095, 4096, 4097]:
+        message = bytes(rng.getrandbits(8) for _ in range(length))
+        assert sm3_hash_optimized(message) == sm3_hash(message), length
+    print(f"压缩函数差分测试通过: {rounds}组随机分组")
+
+
+# 多通道批量实现与逐条计算结果对照
+def test_sm3_hash_batch(count: int = 512):
+    import random
+    rng = random.Random(0x4e50)
+    messages = [bytes(rng.getrandbits(8) for _ in range(rng.choice([0, 3, 55, 56, 64, 100, 200])))
+                for _ in range(count)]
+    assert sm3_hash_batch(messages) == [sm3_hash_optimized(m) for m in messages]
+    for name, backend in BACKENDS.items():
+        if backend.available():
+            assert [d.hex() for d in backend.digest_batch(messages)] == sm3_hash_batch(messages), name
+    print(f"批量SM3测试通过: {count}条消息")
+
+
+# HMAC-SM3 与标准库 hmac（以 SM3 类作为 digestmod）对照，覆盖空密钥、短密钥、整块密钥和超长密钥
+def test_hmac_sm3():
+    import hmac
+    import random
+    rng = random.Random(0x484d)
+    messages = [bytes(rng.getrandbits(8) for _ in range(length)) for length in (0, 3, 55, 64, 200)]
+    for key_length in (0, 10, 64, 100):
+        key = bytes(rng.getrandbits(8) for _ in range(key_length))
+        mac = HMACSM3(key)
+        for message in messages:
+            expected = hmac.new(key, message, digestmod=SM3).digest()
+            assert mac.digest(message) == hmac_sm3(key, message) == expected, (key_length, len(message))
+            # extend(prefix) 之后的对象计算 HMAC(key, prefix || message)
+            for prefix_length in (0, 30, 64, 130):
+                prefix = bytes(rng.getrandbits(8) for _ in range(prefix_length))
+                expected = hmac.new(key, prefix + message, digestmod=SM3).digest()
+                assert mac.extend(prefix).digest(message) == expected, (key_length, prefix_length)
+        assert mac.extend(b"ab").extend(b"cd").digest(b"ef") == mac.digest(b"abcdef")
+    print("HMAC-SM3测试通过")
 
 
 # 测试 sm3
 if __name__ == "__main__":
+    test_compress_function()
+    test_sm3_hash_batch()
+    test_hmac_sm3()
 
     message = b"Hello, SM3!"
     hash_result = sm3_hash_optimized(message)
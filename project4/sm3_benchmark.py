@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from sm3 import BACKENDS, IV, SM3, sm3_hash, sm3_hash_optimized
+
+# project5/sm2.py 通过共享的 sm3 模块计算杂凑值，一并纳入测量
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project5'))
+import sm2
+
+# 各条SM3实现路径：输入bytes，输出十六进制杂凑值
+HASH_PATHS: Dict[str, Callable[[bytes], str]] = {
+    'sm3_hash': sm3_hash,
+    'sm3_hash_optimized': sm3_hash_optimized,
+    'sm2.sm3': lambda message: sm2.sm3(message).hex(),
+}
+# 每个可用后端各自的流式路径
+for _name, _backend in BACKENDS.items():
+    if _backend.available():
+        HASH_PATHS['SM3[' + _name + ']'] = lambda message, _name=_name: SM3(message, backend=_name).hexdigest()
+
+# 各后端的压缩函数：输入(V, 64字节分组)
+COMPRESS_PATHS = {name: backend.compress for name, backend in BACKENDS.items() if backend.available()}
+
+# 默认消息长度：0字节到64MiB
+DEFAULT_SIZES = [0, 64, 1 << 10, 64 << 10, 1 << 20, 64 << 20]
+
+
+def check_consistency(sizes: List[int]) -> List[str]:
+    """所有实现路径对同一消息必须输出相同杂凑值，返回不一致的描述"""
+    errors = []
+    # 覆盖填充边界附近的所有长度，再加上基准测试用到的较小长度
+    lengths = sorted(set(range(0, 130)) | {s for s in sizes if s <= (1 << 16)})
+    for length in lengths:
+        message = os.urandom(length)
+        digests = {name: fn(message) for name, fn in HASH_PATHS.items()}
+        if len(set(digests.values())) != 1:
+            errors.append(f"len={length}: {digests}")
+    # 各后端的批量接口（numpy后端为多通道实现，未安装numpy时跳过）
+    messages = [os.urandom(length) for length in lengths] * 40
+    expected = [sm3_hash(m) for m in messages]
+    for name, backend in BACKENDS.items():
+        if backend.available() and [d.hex() for d in backend.digest_batch(messages)] != expected:
+            errors.append(f"后端{name}的批量接口与sm3_hash结果不一致")
+    return errors
+
+
+def bench_hash(fn: Callable[[bytes], str], size: int, min_time: float) -> Dict[str, float]:
+    """测量单条路径在给定消息长度下的吞吐量与峰值内存"""
+    message = os.urandom(size)
+
+    # 峰值内存单独测一次，避免tracemalloc影响计时
+    tracemalloc.start()
+    fn(message)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while runs == 0 or elapsed < min_time:
+        fn(message)
+        runs += 1
+        elapsed = time.perf_counter() - start
+    seconds = elapsed / runs
+    return {
+        'seconds': seconds,
+        'mb_per_s': size / (1 << 20) / seconds if size else 0.0,
+        'peak_bytes': peak,
+    }
+
+
+def bench_compress(fn, min_time: float) -> float:
+    """测量单次压缩函数调用的平均耗时（微秒）"""
+    block = os.urandom(64)
+    V = IV.copy()
+    runs = 0
+    start = time.perf_counter()
+    while runs == 0 or time.perf_counter() - start < min_time:
+        for _ in range(100):
+            fn(V, block)
+        runs += 100
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def run(sizes: List[int], min_time: float, quiet: bool = False) -> dict:
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'compress_us': {},
+        'hash': {},
+    }
+    for name, fn in COMPRESS_PATHS.items():
+        us = bench_compress(fn, min_time)
+        results['compress_us'][name] = us
+        if not quiet:
+            print(f"{name:<24} {us:10.2f} us/压缩")
+
+    for name, fn in HASH_PATHS.items():
+        results['hash'][name] = {}
+        for size in sizes:
+            r = bench_hash(fn, size, min_time)
+            results['hash'][name][str(size)] = r
+            if not quiet:
+                print(f"{name:<24} {size:>10} B {r['mb_per_s']:10.3f} MB/s "
+                      f"{r['seconds'] * 1e3:12.3f} ms  峰值内存 {r['peak_bytes'] / 1024:10.1f} KiB")
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """与基线对比，耗时或峰值内存超出threshold比例的视为回退"""
+    regressions = []
+    for name, us in results['compress_us'].items():
+        old = baseline.get('compress_us', {}).get(name)
+        if old and us > old * (1 + threshold):
+            regressions.append(f"{name}: {old:.2f} -> {us:.2f} us/压缩")
+    for name, by_size in results['hash'].items():
+        for size, r in by_size.items():
+            old = baseline.get('hash', {}).get(name, {}).get(size)
+            if not old:
+                continue
+            if r['seconds'] > old['seconds'] * (1 + threshold):
+                regressions.append(f"{name} @ {size} B: 耗时 {old['seconds']:.6f}s -> {r['seconds']:.6f}s")
+            if r['peak_bytes'] > old['peak_bytes'] * (1 + threshold) + 4096:
+                regressions.append(f"{name} @ {size} B: 峰值内存 {old['peak_bytes']} -> {r['peak_bytes']} B")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SM3各实现的性能基准与回归测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='测试的消息长度（字节）')
+    parser.add_argument('--max-size', type=int, default=None, help='忽略超过该长度的消息，便于快速运行')
+    parser.add_argument('--min-time', type=float, default=0.2, help='每项测量的最短时间（秒）')
+    parser.add_argument('--save', help='将结果保存为JSON基线')
+    parser.add_argument('--baseline', help='与该JSON基线比较，出现回退时返回非零')
+    parser.add_argument('--threshold', type=float, default=0.10, help='允许的回退比例，默认10%%')
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes if args.max_size is None or s <= args.max_size]
+
+    errors = check_consistency(sizes)
+    if errors:
+        print("杂凑值不一致:", file=sys.stderr)
+        for e in errors:
+            print("  " + e, file=sys.stderr)
+        return 2
+    print("正确性检查通过：所有实现输出一致")
+
+    results = run(sizes, args.min_time)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"基线已保存到 {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"性能回退（阈值 {args.threshold:.0%}）:", file=sys.stderr)
+            for r in regressions:
+                print("  " + r, file=sys.stderr)
+            return 1
+        print("与基线相比无性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from sm3 import SM3, get_backend
+
+# 在计时之前选定全局后端（包括工作进程中重新导入本模块时），避免首个文件的计时包含后端的选择与导入
+get_backend()
+
+# 单个文件的计算结果：(文件名, 杂凑值, 字节数, 耗时秒数, 错误信息)
+FileResult = Tuple[str, Optional[str], int, float, Optional[str]]
+
+
+def hash_file(path: str) -> FileResult:
+    """对单个文件做mmap映射后计算SM3，返回杂凑值与耗时"""
+    start = time.perf_counter()
+    try:
+        h = SM3()
+        if path == '-':
+            # 标准输入无法映射，按块读取
+            size = 0
+            for chunk in iter(lambda: sys.stdin.buffer.read(1 << 20), b''):
+                h.update(chunk)
+                size += len(chunk)
+        else:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                # 空文件不能mmap，直接输出空消息的杂凑值
+                if size > 0:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        with memoryview(mm) as mv:
+                            h.update(mv)
+        return path, h.hexdigest(), size, time.perf_counter() - start, None
+    except OSError as e:
+        return path, None, 0, time.perf_counter() - start, e.strerror or str(e)
+
+
+def hash_files(paths: List[str], jobs: Optional[int] = None) -> List[FileResult]:
+    """在进程池中并行计算多个文件的杂凑值，结果顺序与输入一致"""
+    # 标准输入只能在主进程读取
+    if jobs == 1 or len(paths) <= 1 or '-' in paths:
+        return [hash_file(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(hash_file, paths))
+
+
+def report_speed(path: str, size: int, seconds: float) -> None:
+    """向stderr输出单个文件的吞吐量"""
+    mb = size / (1 << 20)
+    speed = mb / seconds if seconds > 0 else 0.0
+    print(f"{path}: {mb:.2f} MB in {seconds:.3f}s ({speed:.2f} MB/s)", file=sys.stderr)
+
+
+def parse_checksum_line(line: str) -> Optional[Tuple[str, str]]:
+    """解析'<杂凑值>  <文件名>'格式的校验行，格式错误返回None"""
+    line = line.rstrip('\n')
+    if len(line) < 66 or line[64] != ' ' or line[65] not in ' *':
+        return None
+    digest = line[:64].lower()
+    try:
+        int(digest, 16)
+    except ValueError:
+        return None
+    return digest, line[66:]
+
+
+def check(checksum_files: List[str], jobs: Optional[int], quiet: bool) -> int:
+    """--check模式：校验清单中的所有文件，全部通过返回0"""
+    expected = []
+    bad_lines = 0
+    missing = 0
+    for name in checksum_files:
+        # 标准输入不由本函数打开，也不应被关闭
+        try:
+            if name == '-':
+                lines = sys.stdin.readlines()
+            else:
+                with open(name, encoding='utf-8') as f:
+                    lines = f.readlines()
+        except OSError as e:
+            missing += 1
+            print(f"sm3sum: {name}: {e.strerror or e}", file=sys.stderr)
+            continue
+        for line in lines:
+            if not line.strip():
+                continue
+            parsed = parse_checksum_line(line)
+            if parsed is None:
+                bad_lines += 1
+            else:
+                expected.append(parsed)
+
+    results = hash_files([path for _, path in expected], jobs)
+    failed = unreadable = 0
+    for (digest, _), (path, actual, size, seconds, error) in zip(expected, results):
+        if error is not None:
+            unreadable += 1
+            print(f"{path}: FAILED open or read")
+        elif actual != digest:
+            failed += 1
+            print(f"{path}: FAILED")
+        else:
+            print(f"{path}: OK")
+        if error is None and not quiet:
+            report_speed(path, size, seconds)
+
+    if bad_lines:
+        print(f"sm3sum: WARNING: {bad_lines} line(s) improperly formatted", file=sys.stderr)
+    if unreadable:
+        print(f"sm3sum: WARNING: {unreadable} listed file(s) could not be read", file=sys.stderr)
+    if failed:
+        print(f"sm3sum: WARNING: {failed} computed checksum(s) did NOT match", file=sys.stderr)
+    return 1 if (failed or unreadable or bad_lines or missing) else 0
+
+
+def positive_int(value: str) -> int:
+    """argparse参数类型：正整数"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须是正整数，而不是'{value}'")
+    return number
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='sm3sum', description='计算或校验文件的SM3杂凑值')
+    parser.add_argument('files', nargs='*', default=['-'], help="输入文件，'-'表示标准输入")
+    parser.add_argument('-c', '--check', action='store_true', help='从文件中读取SM3校验值并校验')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=None, help='并行进程数，默认为CPU核数')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不输出每个文件的MB/s统计')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return check(args.files, args.jobs, args.quiet)
+
+    status = 0
+    for path, digest, size, seconds, error in hash_files(args.files, args.jobs):
+        if error is not None:
+            print(f"sm3sum: {path}: {error}", file=sys.stderr)
+            status = 1
+            continue
+        print(f"{digest}  {path}")
+        if not args.quiet:
+            report_speed(path, size, seconds)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+from sm3 import sm3_digest, sm3_digest_batch
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 键经SM3映射为256位路径，从根到叶子依次取最高位到最低位
+DEPTH = 256
+
+# 空子树的默认哈希：DEFAULT_HASHES[h] 为高度 h 的全空子树的根
+# 空叶子为32字节全零，非空叶子为 SM3(value)，父节点为 SM3(left || right)（同 MerkleTree 二进制模式）
+DEFAULT_HASHES = [b'\x00' * 32]
+for _ in range(DEPTH):
+    DEFAULT_HASHES.append(sm3_digest(DEFAULT_HASHES[-1] * 2))
+
+# 稀疏证明：(位图, 非默认兄弟节点)，位图第 h 位为1表示高度 h 的兄弟节点不是默认值、出现在列表中
+SparseProof = Tuple[int, List[str]]
+
+# 键到路径：SM3(key) 的256位整数
+def key_path(key: bytes) -> int:
+    return int.from_bytes(sm3_digest(key), 'big')
+
+class SparseMerkleTree:
+    # 以 SM3(key) 为路径的稀疏Merkle树：只存储非默认的节点，
+    # 存在性与不存在性证明长度固定为 DEPTH，默认兄弟节点用位图省略
+    def __init__(self, items: Iterable[Tuple[bytes, bytes]] = ()):
+        self.nodes: Dict[Tuple[int, int], bytes] = {}  # (高度, 路径前缀) -> 非默认节点
+        self.values: Dict[int, bytes] = {}             # 路径 -> 值
+        self.root = DEFAULT_HASHES[DEPTH].hex()
+        self.update_many(items)
+
+    # 读取高度 h、路径前缀为 prefix 的节点，不存在即为默认值
+    def node(self, height: int, prefix: int) -> bytes:
+        return self.nodes.get((height, prefix), DEFAULT_HASHES[height])
+
+    def _set_node(self, height: int, prefix: int, node: bytes):
+        if node == DEFAULT_HASHES[height]:
+            self.nodes.pop((height, prefix), None)
+        else:
+            self.nodes[(height, prefix)] = node
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        return self.values.get(key_path(key))
+
+    # 插入或修改一个键，value 为 None 表示删除
+    def update(self, key: bytes, value: Optional[bytes]):
+        self.update_many([(key, value)])
+
+    # 批量插入/修改/删除：叶子批量哈希，之后逐层只重算受影响的节点，
+    # 多个键共享的上层节点每层只计算一次
+    def update_many(self, items: Iterable[Tuple[bytes, Optional[bytes]]]):
+        changed = {}
+        for key, value in items:
+            changed[key_path(key)] = value  # 同一键以最后一次为准
+        if not changed:
+            return
+
+        inserted = [path for path, value in changed.items() if value is not None]
+        for path, digest in zip(inserted, sm3_digest_batch([changed[path] for path in inserted])):
+            self.values[path] = changed[path]
+            self._set_node(0, path, digest)
+        for path, value in changed.items():
+            if value is None:
+                self.values.pop(path, None)
+                self._set_node(0, path, DEFAULT_HASHES[0])
+
+        prefixes = set(changed)
+        for height in range(DEPTH):
+            parents = sorted({prefix >> 1 for prefix in prefixes})
+            default = DEFAULT_HASHES[height]
+            positions = []
+            messages = []
+            for parent in parents:
+                left = self.node(height, parent << 1)
+                right = self.node(height, (parent << 1) | 1)
+                if left == default and right == default:
+                    # 两个子树均为空，父节点即默认值，无需计算
+                    self._set_node(height + 1, parent, DEFAULT_HASHES[height + 1])
+                else:
+                    positions.append(parent)
+                    messages.append(left + right)
+            for parent, digest in zip(positions, sm3_digest_batch(messages)):
+                self._set_node(height + 1, parent, digest)
+            prefixes = parents
+        self.root = self.node(DEPTH, 0).hex()
+
+    # 获取证明：返回 (值, 稀疏证明)，值为 None 时即为不存在性证明
+    def get_proof(self, key: bytes) -> Tuple[Optional[bytes], SparseProof]:
+        path = key_path(key)
+        bitmap = 0
+        siblings = []
+        for height in range(DEPTH):
+            sibling = self.nodes.get((height, (path >> height) ^ 1))
+            if sibling is not None:
+                bitmap |= 1 << height
+                siblings.append(sibling.hex())
+        return self.values.get(path), (bitmap, siblings)
+
+# 验证证明：value 为 None 时验证该键不存在
+def verify_sparse_proof(key: bytes, value: Optional[bytes], proof: SparseProof, root: str) -> bool:
+    path = key_path(key)
+    bitmap, siblings = proof
+    siblings = iter(siblings)
+    node = DEFAULT_HASHES[0] if value is None else sm3_digest(value)
+    try:
+        for height in range(DEPTH):
+            if bitmap >> height & 1:
+                sibling = bytes.fromhex(next(siblings))
+            elif node == DEFAULT_HASHES[height]:
+                # 当前节点与兄弟节点都是空子树，父节点为默认值
+                node = DEFAULT_HASHES[height + 1]
+                continue
+            else:
+                sibling = DEFAULT_HASHES[height]
+            if path >> height & 1:
+                node = sm3_digest(sibling + node)
+            else:
+                node = sm3_digest(node + sibling)
+    except StopIteration:
+        return False
+    return next(siblings, None) is None and node.hex() == root
+
+# 测试稀疏Merkle树：存在性/不存在性证明、批量与逐个插入结果一致、删除后恢复
+def test_sparse_merkle_tree():
+    items = [(f"key_{i}".encode(), f"value_{i}".encode()) for i in range(50)]
+    tree = SparseMerkleTree(items)
+
+    one_by_one = SparseMerkleTree()
+    for key, value in items:
+        one_by_one.update(key, value)
+    assert one_by_one.root == tree.root
+
+    for key, value in items[:5]:
+        found, proof = tree.get_proof(key)
+        assert found == value
+        assert verify_sparse_proof(key, value, proof, tree.root)
+        assert not verify_sparse_proof(key, b"forged", proof, tree.root)
+        assert not verify_sparse_proof(key, None, proof, tree.root)
+
+    missing = b"missing_key"
+    found, proof = tree.get_proof(missing)
+    assert found is None
+    assert verify_sparse_proof(missing, None, proof, tree.root)
+    assert not verify_sparse_proof(missing, b"value", proof, tree.root)
+    print(f"不存在性证明: 固定路径长度 {DEPTH}，实际携带 {len(proof[1])} 个非默认兄弟节点")
+
+    tree.update_many([(key, None) for key, _ in items[25:]])
+    assert tree.root == SparseMerkleTree(items[:25]).root
+    tree.update_many([(key, None) for key, _ in items[:25]])
+    assert tree.root == DEFAULT_HASHES[DEPTH].hex() and not tree.nodes
+    print("稀疏Merkle树测试通过")
+
+if __name__ == "__main__":
+    test_sparse_merkle_tree()
@@ -1,55 +1,21 @@
-from typing import Tuple, Optional
+import functools
+import hashlib
+import mmap
+import os
+import sys
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 # === SM2 椭圆曲线参数 (sm2p256v1, GM/T 0003.1-2012) ===
 p  = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFF
 a  = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFC
-b  = 0x28E9FA9E9D9F5E344D5AEF1353E9DA3113B5F0B8C00A60B1CE1D7E819D7A431
+b  = 0x28E9FA9E9D9F5E344D5A9E4BCF6509A7F39789F515AB8F92DDBCBD414D940E93
 n  = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFF7203DF6B21C6052B53BBF40939D54123
 Gx = 0x32C4AE2C1F1981195F9904466A39C9948FE30BBFF2660BE1715A4589334C74C7
 Gy = 0xBC3736A2F4F6779C59BDCEE36B692153D0A9877CC62A474002DF32E52139F0A0
 
-# === 最小化 SM3 实现 (大端模式) ===
-def _rotl32(x, r): return ((x << r) | (x >> (32 - r))) & 0xFFFFFFFF
-def _P0(x): return x ^ _rotl32(x, 9) ^ _rotl32(x, 17)
-def _P1(x): return x ^ _rotl32(x, 15) ^ _rotl32(x, 23)
-
-def sm3(data: bytes) -> bytes:
-    # 初始向量
-    IV = [0x7380166F,0x4914B2B9,0x172442D7,0xDA8A0600,0xA96F30BC,0x163138AA,0xE38DEE4D,0xB0FB0E4E]
-    msg = bytearray(data)
-    bit_len = (8 * len(msg)) & ((1 << 64) - 1)
-    # 填充 0x80
-    msg.append(0x80)
-    while (len(msg) + 8) % 64 != 0:
-        msg.append(0)
-    msg += bit_len.to_bytes(8, 'big')
-    V = IV[:]
-    # 分组处理
-    for i in range(0, len(msg), 64):
-        B = msg[i:i+64]
-        W = [int.from_bytes(B[j:j+4], 'big') for j in range(0, 64, 4)]
-        for j in range(16, 68):
-            W.append(_P1(W[j-16] ^ W[j-9] ^ _rotl32(W[j-3], 15)) ^ _rotl32(W[j-13], 7) ^ W[j-6])
-        Wp = [(W[j] ^ W[j+4]) & 0xFFFFFFFF for j in range(64)]
-        A,Bc,C,D,E,F,G,H = V
-        for j in range(64):
-            Tj = 0x79CC4519 if j < 16 else 0x7A879D8A
-            FF = (A ^ Bc ^ C) if j < 16 else ((A & Bc) | (A & C) | (Bc & C))
-            GG = (E ^ F ^ G) if j < 16 else ((E & F) | ((~E) & G))
-            SS1 = _rotl32((_rotl32(A,12) + E + _rotl32(Tj, j % 32)) & 0xFFFFFFFF, 7)
-            SS2 = SS1 ^ _rotl32(A,12)
-            TT1 = (FF + D + SS2 + Wp[j]) & 0xFFFFFFFF
-            TT2 = (GG + H + SS1 + W[j]) & 0xFFFFFFFF
-            D = C
-            C = _rotl32(Bc,9)
-            Bc= A
-            A = TT1
-            H = G
-            G = _rotl32(F,19)
-            F = E
-            E = _P0(TT2)
-        V = [(x ^ y) & 0xFFFFFFFF for x,y in zip(V, [A,Bc,C,D,E,F,G,H])]
-    return b''.join(v.to_bytes(4,'big') for v in V)
+# === SM3：使用 project4/sm3.py 中的共享实现（后端在首次使用时选定） ===
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project4'))
+from sm3 import sm3_digest as sm3, HMACSM3, SM3Prefix
 
 # === 有限域运算 mod p ===
 def inv_mod(x: int, m: int=p) -> int:
@@ -73,6 +39,24 @@ def from_jac(PJ: Tuple[int,int,int]) -> Optional[Tuple[int,int]]:
     y = (Y*Zi2*Zi) % p
     return (x, y)
 
+def batch_from_jac(points: List[Tuple[int,int,int]]) -> List[Optional[Tuple[int,int]]]:
+    # Montgomery 批量求逆：所有点转仿射坐标只需一次域内求逆
+    prefix = []
+    acc = 1
+    for X,Y,Z in points:
+        prefix.append(acc)
+        if Z != 0: acc = (acc*Z) % p
+    inv = inv_mod(acc)
+    result = [None]*len(points)
+    for i in range(len(points)-1, -1, -1):
+        X,Y,Z = points[i]
+        if Z == 0: continue
+        Zi = (inv*prefix[i]) % p
+        inv = (inv*Z) % p
+        Zi2 = (Zi*Zi) % p
+        result[i] = ((X*Zi2) % p, (Y*Zi2*Zi) % p)
+    return result
+
 def j_add(P: Tuple[int,int,int], Q: Tuple[int,int,int]) -> Tuple[int,int,int]:
     # Jacobian 坐标点加法
     if P[2]==0: return Q
@@ -95,8 +79,43 @@ def j_add(P: Tuple[int,int,int], Q: Tuple[int,int,int]) -> Tuple[int,int,int]:
     Z3 = (Z3*H) % p
     return (X3,Y3,Z3)
 
+def j_add_affine(P: Tuple[int,int,int], Q: Tuple[int,int]) -> Tuple[int,int,int]:
+    # Jacobian + 仿射坐标混合加法（madd-2007-bl）：Q 的 Z=1，7M + 4S，比一般加法少 4M + 1S
+    X1,Y1,Z1 = P
+    x2,y2 = Q
+    if Z1 == 0: return (x2, y2, 1)
+    Z1Z1 = (Z1*Z1) % p
+    U2 = (x2*Z1Z1) % p
+    S2 = (y2*Z1*Z1Z1) % p
+    H = (U2 - X1) % p
+    r = (2*(S2 - Y1)) % p
+    if H == 0:
+        if r != 0: return O
+        return j_double(P)
+    HH = (H*H) % p
+    I = (4*HH) % p
+    J = (H*I) % p
+    V = (X1*I) % p
+    X3 = (r*r - J - 2*V) % p
+    Y3 = (r*(V - X3) - 2*(Y1*J)) % p
+    Z3 = ((Z1+H)**2 - Z1Z1 - HH) % p
+    return (X3,Y3,Z3)
+
 def j_double(P: Tuple[int,int,int]) -> Tuple[int,int,int]:
-    # Jacobian 坐标点倍加
+    # Jacobian 坐标点倍加，利用 a = -3：3X^2 + aZ^4 = 3(X - Z^2)(X + Z^2)（dbl-2001-b），3M + 5S
+    X,Y,Z = P
+    if Z==0 or Y==0: return O
+    delta = (Z*Z) % p
+    gamma = (Y*Y) % p
+    beta = (X*gamma) % p
+    alpha = (3*(X - delta)*(X + delta)) % p
+    X3 = (alpha*alpha - 8*beta) % p
+    Z3 = ((Y+Z)**2 - gamma - delta) % p
+    Y3 = (alpha*(4*beta - X3) - 8*(gamma*gamma)) % p
+    return (X3,Y3,Z3)
+
+def j_double_generic(P: Tuple[int,int,int]) -> Tuple[int,int,int]:
+    # 任意 a 的 Jacobian 倍点公式，作为对照保留（见 sm2_benchmark.py）
     X,Y,Z = P
     if Z==0 or Y==0: return O
     A_ = (X*X) % p
@@ -109,7 +128,7 @@ def j_double(P: Tuple[int,int,int]) -> Tuple[int,int,int]:
     Z3 = (2*Y*Z) % p
     return (X3,Y3,Z3)
 
-# === wNAF 标量乘，G 为固定基点预计算 ===
+# === wNAF 标量乘（任意基点） ===
 def naf(k: int, w: int=5):
     # 将 k 表示为 NAF 形式，数字范围 [-2^{w-1}+1, ..., 2^{w-1}-1]
     digits = []
@@ -124,56 +143,167 @@ def naf(k: int, w: int=5):
         k >>= 1
     return digits
 
-def precompute_G(w: int=5):
-    # 预计算奇数倍 G: G, 3G, 5G, ...
-    GJ = to_jac((Gx,Gy))
-    table = []
-    P = GJ
-    table.append(P)
-    dbl = j_double(GJ)
-    for _ in range(1, (1<<(w-1))):
-        P = j_add(P, dbl)
-        table.append(P)
+# === 固定基点 G 的按字节窗口预计算表 ===
+# _G_COMB[i][j-1] = j·256^i·G（仿射坐标），i = 0..31，j = 1..255
+# k·G = Σ_i _G_COMB[i][k 的第 i 个字节]，约 32 次点加、不需要倍点
+G_TABLE_WINDOWS = 32
+G_TABLE_CACHE = os.environ.get('SM2_G_TABLE',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sm2_g_table.bin'))
+_G_TABLE_MAGIC = b'SM2GTBL1'
+# 整个缓存文件的 SHA-256：表是固定常量，任何一个点被改动都会导致校验失败并重新生成
+_G_TABLE_SHA256 = '66cc199f3228b101354cb1df0ca558448eac320f8cf75b5e8447a39566870578'
+
+def build_G_table() -> List[List[Tuple[int,int]]]:
+    # 每个窗口的 1..255 倍以仿射的窗口基点做混合加法累加，最后一次批量转为仿射坐标
+    points = []
+    base = (Gx,Gy)
+    for _ in range(G_TABLE_WINDOWS):
+        P = to_jac(base)
+        points.append(P)
+        for _ in range(254):
+            P = j_add_affine(P, base)
+            points.append(P)
+        base = from_jac(j_add_affine(P, base))  # 256^(i+1)·G
+    affine = batch_from_jac(points)
+    return [affine[i*255:(i+1)*255] for i in range(G_TABLE_WINDOWS)]
+
+def save_G_table(table: List[List[Tuple[int,int]]], path: str=G_TABLE_CACHE) -> None:
+    # 文件格式：魔数 || 每个点 64 字节 (x || y，大端)；先写临时文件再替换，避免并发读到半个文件
+    tmp = path + '.%d.tmp' % os.getpid()
+    with open(tmp, 'wb') as f:
+        f.write(_G_TABLE_MAGIC)
+        for window in table:
+            for x,y in window:
+                f.write(x.to_bytes(32,'big') + y.to_bytes(32,'big'))
+    os.replace(tmp, path)
+
+def load_G_table(path: str=G_TABLE_CACHE) -> Optional[List[List[Tuple[int,int]]]]:
+    # 映射缓存文件并解析；文件缺失、长度不符或内容摘要与 _G_TABLE_SHA256 不一致时返回 None
+    size = len(_G_TABLE_MAGIC) + G_TABLE_WINDOWS*255*64
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) != size or hashlib.sha256(mm).hexdigest() != _G_TABLE_SHA256:
+                return None
+            values = [int.from_bytes(mm[i:i+32], 'big') for i in range(len(_G_TABLE_MAGIC), size, 32)]
+    except (OSError, ValueError):
+        return None
+    points = list(zip(values[0::2], values[1::2]))
+    return [points[i*255:(i+1)*255] for i in range(G_TABLE_WINDOWS)]
+
+def load_or_build_G_table() -> List[List[Tuple[int,int]]]:
+    # 导入时只读缓存，缺失或校验失败时在内存中重新生成，不写文件；缓存由 python sm2.py --build-g-table 显式生成
+    table = load_G_table()
+    if table is None:
+        table = build_G_table()
     return table
 
-_G_TABLE = precompute_G()
+_G_COMB = load_or_build_G_table()
 
-def scalar_mul_G(k: int) -> Tuple[int,int]:
-    if k % n == 0: return None
-    w = 5
-    digits = naf(k, w)
+def scalar_mul_G_jac(k: int) -> Tuple[int,int,int]:
+    # 查表累加，结果保留 Jacobian 坐标，便于与其他项继续相加
+    k %= n
     R = O
-    for di in reversed(digits):
-        R = j_double(R)
-        if di != 0:
-            idx = (abs(di)//2)
-            PJ = _G_TABLE[idx]
-            R = j_add(R, PJ if di>0 else (PJ[0], (-PJ[1])%p, PJ[2]))
-    return from_jac(R)
+    for window in _G_COMB:
+        if not k: break
+        byte = k & 0xFF
+        if byte:
+            R = j_add_affine(R, window[byte-1])
+        k >>= 8
+    return R
 
-def scalar_mul(P: Tuple[int,int], k: int) -> Optional[Tuple[int,int]]:
-    if P is None or k % n == 0: return None
-    w = 5
-    PJ = to_jac(P)
-    # 针对任意基点的动态表
+def scalar_mul_G(k: int) -> Optional[Tuple[int,int]]:
+    return from_jac(scalar_mul_G_jac(k))
+
+def odd_multiples_jac(PJ: Tuple[int,int,int], w: int=5) -> List[Tuple[int,int,int]]:
+    # wNAF 用的奇数倍表 P, 3P, 5P, ..., (2^{w-1}-1)P（Jacobian 坐标）
     table = [PJ]
     dbl = j_double(PJ)
-    for _ in range(1, (1<<(w-1))):
+    for _ in range(1, (1<<(w-2))):
         table.append(j_add(table[-1], dbl))
-    digits = naf(k, w)
+    return table
+
+def odd_multiples(PJ: Tuple[int,int,int], w: int=5) -> List[Tuple[int,int]]:
+    # 同上，一次批量求逆转为仿射坐标以便混合加法
+    return batch_from_jac(odd_multiples_jac(PJ, w))
+
+# === 多标量乘 Σ k_i·P_i（交错 wNAF） ===
+def wnaf_chain(tables: Sequence[List[Tuple[int,int]]], scalars: Sequence[int], w: int=5) -> Tuple[int,int,int]:
+    # 各项的仿射奇数倍表已就绪时，交错 wNAF 共享同一条倍点链，结果为 Jacobian 坐标
+    digits = [naf(k % n, w) for k in scalars]
+    acc = O
+    for i in range(max(map(len, digits), default=0) - 1, -1, -1):
+        acc = j_double(acc)
+        for table, ds in zip(tables, digits):
+            if i >= len(ds) or ds[i] == 0: continue
+            di = ds[i]
+            T = table[abs(di)//2]
+            acc = j_add_affine(acc, T if di>0 else (T[0], (-T[1])%p))
+    return acc
+
+def multi_scalar_mul(terms: Sequence[Tuple[Optional[Tuple[int,int]], int]], w: int=5) -> Optional[Tuple[int,int]]:
+    # 各项共享同一条倍点链；所有项的奇数倍表先在 Jacobian 坐标下建好，
+    # 再合并做一次批量求逆转为仿射坐标，加上最后的结果转换，共两次求逆，与项数无关；
+    # 基点为 G 的项改用按字节窗口表累加，不参与倍点链
     R = O
-    for di in reversed(digits):
-        R = j_double(R)
-        if di != 0:
-            idx = (abs(di)//2)
-            T = table[idx]
-            R = j_add(R, T if di>0 else (T[0], (-T[1])%p, T[2]))
-    return from_jac(R)
+    points = []
+    scalars = []
+    for P, k in terms:
+        k %= n
+        if P is None or k == 0: continue
+        if P == (Gx, Gy):
+            R = j_add(R, scalar_mul_G_jac(k))
+            continue
+        points.extend(odd_multiples_jac(to_jac(P), w))
+        scalars.append(k)
+    size = 1 << (w-2)
+    affine = batch_from_jac(points) if points else []
+    tables = [affine[i:i+size] for i in range(0, len(affine), size)]
+    return from_jac(j_add(R, wnaf_chain(tables, scalars, w)))
+
+def scalar_mul(P: Tuple[int,int], k: int) -> Optional[Tuple[int,int]]:
+    return multi_scalar_mul([(P, k)])
 
 # === 工具函数 ===
 def bytes_be(x: int, length: int=32) -> bytes: return x.to_bytes(length, 'big')
 def int_be(b: bytes) -> int: return int.from_bytes(b, 'big')
 
+# === 公钥编码（SEC1）===
+# 压缩格式 02/03 || x（33 字节），非压缩格式 04 || x || y（65 字节）
+def encode_point(P: Tuple[int,int], compressed: bool=True) -> bytes:
+    x, y = P
+    if compressed:
+        return bytes([2 | (y & 1)]) + bytes_be(x)
+    return b'\x04' + bytes_be(x) + bytes_be(y)
+
+def _decode_point(data: bytes) -> Tuple[Optional[Tuple[int,int]], str]:
+    # 返回 (点, 错误信息)，解码成功时错误信息为空
+    if len(data) == 33 and data[0] in (2, 3):
+        x = int_be(data[1:])
+        if x >= p: return None, "x 坐标超出范围"
+        rhs = (x*x*x + a*x + b) % p
+        # p ≡ 3 (mod 4)，平方根为 rhs^((p+1)/4)；平方回去不等于 rhs 说明 x 不在曲线上
+        y = pow(rhs, (p+1)//4, p)
+        if (y*y) % p != rhs: return None, "点不在曲线上"
+        if (y & 1) != (data[0] & 1): y = p - y
+        return (x, y), ""
+    if len(data) == 65 and data[0] == 4:
+        x, y = int_be(data[1:33]), int_be(data[33:])
+        if x >= p or y >= p: return None, "坐标超出范围"
+        if (y*y - x*x*x - a*x - b) % p != 0: return None, "点不在曲线上"
+        return (x, y), ""
+    return None, "无效的公钥编码长度或前缀"
+
+def decode_point(data: bytes) -> Tuple[int,int]:
+    # 解码并校验公钥，格式错误或不在曲线上时抛出 ValueError（SM2 曲线余因子为 1，曲线上的点即在 G 生成的群中）
+    P, error = _decode_point(data)
+    if P is None:
+        raise ValueError("{}: {}".format(error, data.hex()))
+    return P
+
+def decode_points(encoded: Iterable[bytes]) -> List[Optional[Tuple[int,int]]]:
+    # 批量解码，结果与输入一一对应，非法公钥为 None，不中断其余公钥的解码
+    return [_decode_point(data)[0] for data in encoded]
+
 def ZA(ID: bytes, Px: int, Py: int) -> bytes:
     # ENTL = ID 的比特长度
     ENTL = (len(ID)*8).to_bytes(2,'big')
@@ -186,30 +316,27 @@ def sm2_hash_with_ZA(msg: bytes, ID: bytes, Px: int, Py: int) -> int:
     return int_be(e) % n
 
 # 基于 RFC6979 的 SM3/SM2 确定性 k（可替换为安全随机数）
-import hmac, hashlib
-def deterministic_k(d: int, e: int) -> int:
-    # 这里用 HMAC-SM3 生成，避免依赖外部库
-    def hmac_sm3(key: bytes, data: bytes) -> bytes:
-        block = 64
-        if len(key) > block: key = sm3(key)
-        key = key + b'\x00'*(block-len(key))
-        o = bytes([x ^ 0x5c for x in key])
-        i = bytes([x ^ 0x36 for x in key])
-        return sm3(o + sm3(i + data))
+_HMAC_ZERO_KEY = HMACSM3(b'\x00'*32)
+
+def deterministic_k_prefix(d: int) -> HMACSM3:
+    # 第一次 HMAC 的输入 V || 0x00 || x 只与私钥有关，超过一个分组的部分可按密钥预先压缩
+    return _HMAC_ZERO_KEY.extend(b'\x01'*32 + b'\x00' + d.to_bytes(32,'big'))
+
+def deterministic_k(d: int, e: int, prefix: Optional[HMACSM3]=None) -> int:
+    # 这里用 HMAC-SM3 生成，避免依赖外部库；每个 K 只预编译一次密钥
     x = d.to_bytes(32,'big')
     m = e.to_bytes(32,'big')
     V = b'\x01'*32
-    K = b'\x00'*32
-    K = hmac_sm3(K, V + b'\x00' + x + m)
-    V = hmac_sm3(K, V)
-    K = hmac_sm3(K, V + b'\x01' + x + m)
-    V = hmac_sm3(K, V)
+    K = HMACSM3((prefix or deterministic_k_prefix(d)).digest(m))
+    V = K.digest(V)
+    K = HMACSM3(K.digest(V + b'\x01' + x + m))
+    V = K.digest(V)
     while True:
-        V = hmac_sm3(K, V)
+        V = K.digest(V)
         k = (int_be(V) % n) or 1
         if 1 <= k < n: return k
-        K = hmac_sm3(K, V + b'\x00')
-        V = hmac_sm3(K, V)
+        K = HMACSM3(K.digest(V + b'\x00'))
+        V = K.digest(V)
 
 # === SM2 密钥生成 / 签名 / 验证 ===
 def sm2_keygen(d: Optional[int]=None) -> Tuple[int, Tuple[int,int]]:
@@ -218,42 +345,205 @@ def sm2_keygen(d: Optional[int]=None) -> Tuple[int, Tuple[int,int]]:
     P = scalar_mul_G(d)
     return d, P
 
-def sm2_sign(msg: bytes, d: int, ID: bytes=b'1234567812345678', P: Optional[Tuple[int,int]]=None) -> Tuple[int,int]:
-    P = P or scalar_mul_G(d)
-    e = sm2_hash_with_ZA(msg, ID, P[0], P[1])
+# 批量生成密钥：每块 chunk_size 个私钥一次取随机字节，公钥走固定基点表，
+# 整块的 Jacobian 结果用一次批量求逆转为仿射坐标；逐块产出，内存占用与 count 无关
+def sm2_keygen_many(count: int, chunk_size: int=1024) -> Iterator[Tuple[int, Tuple[int,int]]]:
+    # 参数在调用时立即检查，而不是推迟到第一次迭代
+    if chunk_size < 1:
+        raise ValueError("chunk_size必须为正整数，而不是{}".format(chunk_size))
+    return _keygen_chunks(count, chunk_size)
+
+def _keygen_chunks(count: int, chunk_size: int) -> Iterator[Tuple[int, Tuple[int,int]]]:
+    import secrets
+    while count > 0:
+        size = min(chunk_size, count)
+        ds = []
+        while len(ds) < size:
+            buf = secrets.token_bytes(32*(size - len(ds)))
+            for i in range(0, len(buf), 32):
+                d = int_be(buf[i:i+32])
+                if 1 <= d < n:  # 与 sm2_keygen 相同，私钥均匀分布于 [1, n-1]
+                    ds.append(d)
+        for d, P in zip(ds, batch_from_jac([scalar_mul_G_jac(d) for d in ds])):
+            yield d, P
+        count -= size
+
+# 紧凑二进制格式：每个密钥 96 字节 d || x || y（大端），返回写入的密钥个数
+KEY_RECORD_SIZE = 96
+
+def write_keys(f: BinaryIO, keys: Iterable[Tuple[int, Tuple[int,int]]]) -> int:
+    count = 0
+    for d, (x, y) in keys:
+        f.write(bytes_be(d) + bytes_be(x) + bytes_be(y))
+        count += 1
+    return count
+
+def read_keys(f: BinaryIO) -> Iterator[Tuple[int, Tuple[int,int]]]:
     while True:
-        k = deterministic_k(d, e)
-        x1, y1 = scalar_mul_G(k)
+        record = f.read(KEY_RECORD_SIZE)
+        if len(record) < KEY_RECORD_SIZE: return
+        yield int_be(record[:32]), (int_be(record[32:64]), int_be(record[64:]))
+
+# === 签名私钥对象 ===
+class Signer:
+    # 预计算某个私钥的全部签名准备工作：公钥、ZA 之后的 SM3 中间状态、(1+d)^-1 mod n
+    # 以及确定性 k 的首个 HMAC 中间状态，签名结果与 sm2_sign 完全一致
+    def __init__(self, d: int, ID: bytes=b'1234567812345678', P: Optional[Tuple[int,int]]=None):
+        self.d = d
+        self.ID = ID
+        self.P = P or scalar_mul_G(d)
+        self.za = ZA(ID, self.P[0], self.P[1])
+        self._prefix = SM3Prefix(self.za)
+        self._inv_1d = inv_mod(1 + d, n)
+        self._k_prefix = deterministic_k_prefix(d)
+
+    # e = SM3(ZA || msg) mod n
+    def hash(self, msg: bytes) -> int:
+        return int_be(self._prefix.digest(msg)) % n
+
+    # 由 k 与 x1 得到签名，r 或 s 不合法时返回 None
+    def _finish(self, e: int, k: int, x1: int) -> Optional[Tuple[int,int]]:
         r = (e + x1) % n
-        if r == 0 or r + k == n: 
-            continue
-        s = (inv_mod(1 + d, n) * (k - r*d)) % n
-        if s != 0:
-            return (r, s)
+        if r == 0 or r + k == n:
+            return None
+        s = (self._inv_1d * (k - r*self.d)) % n
+        return (r, s) if s != 0 else None
+
+    def sign(self, msg: bytes) -> Tuple[int,int]:
+        e = self.hash(msg)
+        while True:
+            k = deterministic_k(self.d, e, self._k_prefix)
+            x1, y1 = scalar_mul_G(k)
+            sig = self._finish(e, k, x1)
+            if sig is not None:
+                return sig
+
+    # 批量签名：各 k·G 保留 Jacobian 坐标，一次批量求逆得到全部 x1
+    def sign_many(self, msgs: Iterable[bytes]) -> List[Tuple[int,int]]:
+        msgs = list(msgs)
+        es = [self.hash(msg) for msg in msgs]
+        ks = [deterministic_k(self.d, e, self._k_prefix) for e in es]
+        points = batch_from_jac([scalar_mul_G_jac(k) for k in ks])
+        sigs = []
+        for msg, e, k, (x1, y1) in zip(msgs, es, ks, points):
+            sig = self._finish(e, k, x1)
+            # 极小概率的非法 r/s 交给 sign 按原流程处理
+            sigs.append(sig if sig is not None else self.sign(msg))
+        return sigs
+
+def sm2_sign(msg: bytes, d: int, ID: bytes=b'1234567812345678', P: Optional[Tuple[int,int]]=None) -> Tuple[int,int]:
+    return Signer(d, ID, P).sign(msg)
+
+# === 验签公钥对象与缓存 ===
+VERIFIER_WINDOW = 7        # 公钥倍数表的 wNAF 窗口：32 个奇数倍点，每次验签约 32 次点加
+VERIFIER_CACHE_SIZE = 1024 # get_verifier 的 LRU 容量
+
+class Verifier:
+    # 预计算某个 (ID, P) 的全部验签准备工作：ZA 之后的 SM3 中间状态，
+    # 以及仿射坐标的奇数倍表，之后每次验签只剩杂凑与一次多标量乘
+    def __init__(self, P: Tuple[int,int], ID: bytes=b'1234567812345678', w: int=VERIFIER_WINDOW):
+        self.P = P
+        self.ID = ID
+        self.w = w
+        self.za = ZA(ID, P[0], P[1])
+        self._prefix = SM3Prefix(self.za)
+        self.table = odd_multiples(to_jac(P), w)
+
+    # e = SM3(ZA || msg) mod n
+    def hash(self, msg: bytes) -> int:
+        return int_be(self._prefix.digest(msg)) % n
+
+    # 签名格式正确时返回 s·G + t·P（Jacobian 坐标），否则返回 None
+    def point_jac(self, sig: Tuple[int,int]) -> Optional[Tuple[int,int,int]]:
+        r, s = sig
+        if not (1 <= r < n and 1 <= s < n):
+            return None
+        t = (r + s) % n
+        if t == 0: return None
+        return j_add(scalar_mul_G_jac(s), wnaf_chain([self.table], [t], self.w))
+
+    def verify(self, msg: bytes, sig: Tuple[int,int]) -> bool:
+        RJ = self.point_jac(sig)
+        if RJ is None: return False
+        R = from_jac(RJ)
+        if R is None: return False
+        return (self.hash(msg) + R[0]) % n == sig[0]
+
+@functools.lru_cache(maxsize=VERIFIER_CACHE_SIZE)
+def _cached_verifier(P: Tuple[int,int], ID: bytes) -> Verifier:
+    return Verifier(P, ID)
+
+# 按 (P, ID) 缓存 Verifier，反复出现的公钥跳过全部预计算；
+# P 与 ID 先转为 tuple / bytes，list、bytearray 等不可哈希的输入也能使用缓存
+def get_verifier(P: Tuple[int,int], ID: bytes=b'1234567812345678') -> Verifier:
+    return _cached_verifier(tuple(P), bytes(ID))
 
 def sm2_verify(msg: bytes, sig: Tuple[int,int], P: Tuple[int,int], ID: bytes=b'1234567812345678') -> bool:
-    r, s = sig
-    if not (1 <= r < n and 1 <= s < n):
-        return False
-    e = sm2_hash_with_ZA(msg, ID, P[0], P[1])
-    t = (r + s) % n
-    if t == 0: return False
-    # 计算 s*G + t*P
-    P1 = scalar_mul_G(s)
-    P2 = scalar_mul(P, t)
-    if P1 is None or P2 is None: return False
-    X1, Y1 = P1
-    X2, Y2 = P2
-    R = from_jac(j_add(to_jac((X1,Y1)), to_jac((X2,Y2))))
-    if R is None: return False
-    x_, y_ = R
-    R_ = (e + x_) % n
-    return R_ == r
+    return get_verifier(P, ID).verify(msg, sig)
+
+# 批量验签：items 为 (msg, sig, P) 或 (msg, sig, P, ID)，返回与输入一一对应的结果列表。
+# 同一 (ID, P) 的预计算通过 get_verifier 共享；各签名的 s·G + t·P 保留 Jacobian 坐标，
+# 最后用一次批量求逆统一转为仿射坐标。SM2 签名只携带 R 的 x 坐标，
+# 无法像 Schnorr 那样做随机线性组合的整体校验，因此每条签名都单独判定，坏签名直接体现在结果中
+def sm2_verify_batch(items: Iterable[Sequence]) -> List[bool]:
+    results = []
+    pending = []  # (结果下标, r, e, Jacobian 点)
+    for item in items:
+        msg, sig, P = item[:3]
+        ID = item[3] if len(item) > 3 else b'1234567812345678'
+        results.append(False)
+        verifier = get_verifier(P, ID)
+        RJ = verifier.point_jac(sig)
+        if RJ is None: continue
+        pending.append((len(results) - 1, sig[0], verifier.hash(msg), RJ))
+    affine = batch_from_jac([RJ for _, _, _, RJ in pending])
+    for (i, r, e, _), R in zip(pending, affine):
+        results[i] = R is not None and (e + R[0]) % n == r
+    return results
 
 # === 自测 ===
 if __name__ == "__main__":
+    if sys.argv[1:] == ['--build-g-table']:
+        save_G_table(_G_COMB)
+        assert load_G_table() == _G_COMB
+        print("预计算表已写入", G_TABLE_CACHE)
+        sys.exit(0)
+
     d, P = sm2_keygen()
     m = b"hello sm2"
     sig = sm2_sign(m, d, P=P)
     print("签名:", tuple(hex(x) for x in sig))
     print("验证结果: ", sm2_verify(m, sig, P))
+
+    d2, P2 = sm2_keygen()
+    items = [(m + bytes([i]), sm2_sign(m + bytes([i]), d, P=P), P) for i in range(8)]
+    items.append((b"other id", sm2_sign(b"other id", d2, ID=b"alice", P=P2), P2, b"alice"))
+    items.append((b"forged", items[0][1], P))
+    items.append((m, (0, 1), P))
+    results = sm2_verify_batch(items)
+    assert results == [sm2_verify(*item) for item in items] == [True]*9 + [False]*2
+    print("批量验证结果:", results)
+
+    signer = Signer(d, P=P)
+    msgs = [m + bytes([i]) for i in range(8)]
+    assert signer.sign_many(msgs) == [signer.sign(x) for x in msgs] == [item[1] for item in items[:8]]
+
+    import io
+    buf = io.BytesIO()
+    assert write_keys(buf, sm2_keygen_many(10, chunk_size=4)) == 10
+    buf.seek(0)
+    keys = list(read_keys(buf))
+    assert len(keys) == 10 and all(scalar_mul_G(d) == P for d, P in keys)
+    try:
+        sm2_keygen_many(1, chunk_size=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("chunk_size=0 应当被拒绝")
+    print("批量密钥生成测试通过")
+
+    for _, Q in keys:
+        assert decode_point(encode_point(Q)) == Q == decode_point(encode_point(Q, compressed=False))
+    bad = [b'\x02' + bytes_be(p), b'\x04' + bytes_be(Q[0]) + bytes_be(Q[1] ^ 1), b'\x05' + bytes(32)]
+    assert decode_points([encode_point(Q) for _, Q in keys] + bad) == [Q for _, Q in keys] + [None]*3
+    print("公钥编码测试通过")
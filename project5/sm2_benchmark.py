@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import secrets
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import sm2
+from sm2 import Gx, Gy, n, p
+
+
+class FieldElement(int):
+    """统计域运算次数的整数：两个大数相乘记为 M（相同的数记为 S），模幂记为 I
+
+    与小常数（如 2、3、8）相乘只是移位与加法，不计入 M。
+    """
+    counts = {'M': 0, 'S': 0, 'I': 0}
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.counts = {'M': 0, 'S': 0, 'I': 0}
+
+    def _count_mul(self, other: int) -> None:
+        if not isinstance(other, FieldElement) and abs(other) < (1 << 16):
+            return
+        FieldElement.counts['S' if int(self) == int(other) else 'M'] += 1
+
+    def __mul__(self, other):
+        self._count_mul(other)
+        return FieldElement(int(self) * int(other))
+    __rmul__ = __mul__
+
+    def __pow__(self, exponent, modulus=None):
+        if modulus is not None:
+            FieldElement.counts['I'] += 1
+            return FieldElement(pow(int(self), exponent, modulus))
+        if exponent == 2:
+            FieldElement.counts['S'] += 1
+        else:
+            FieldElement.counts['M'] += exponent - 1
+        return FieldElement(int(self) ** exponent)
+
+    def __add__(self, other): return FieldElement(int(self) + int(other))
+    def __radd__(self, other): return FieldElement(int(other) + int(self))
+    def __sub__(self, other): return FieldElement(int(self) - int(other))
+    def __rsub__(self, other): return FieldElement(int(other) - int(self))
+    def __mod__(self, other): return FieldElement(int(self) % int(other))
+    def __neg__(self): return FieldElement(-int(self))
+
+
+def counted(point):
+    """将点的坐标换成 FieldElement，之后的所有运算都会被统计"""
+    return tuple(FieldElement(c) for c in point)
+
+
+# 费马求逆 x^(p-2) 的平方-乘法次数，用于把求逆折算为乘法
+INVERSION_M = (p - 2).bit_length() - 1 + bin(p - 2).count('1') - 1
+
+
+def m_equivalent(counts: Dict[str, int]) -> int:
+    """M + S + 折算后的求逆（平方按一次乘法计）"""
+    return counts['M'] + counts['S'] + counts['I'] * INVERSION_M
+
+
+def jacobian_multi_scalar_mul(terms, w: int = 5):
+    """优化前的多标量乘：奇数倍表保留 Jacobian 坐标、做一般加法，只在最后求逆一次"""
+    R = sm2.O
+    tables = []
+    digits = []
+    for P, k in terms:
+        k %= n
+        if P is None or k == 0:
+            continue
+        if P == (Gx, Gy):
+            R = sm2.j_add(R, sm2.scalar_mul_G_jac(k))
+            continue
+        tables.append(sm2.odd_multiples_jac(sm2.to_jac(P), w))
+        digits.append(sm2.naf(k, w))
+    acc = sm2.O
+    for i in range(max(map(len, digits), default=0) - 1, -1, -1):
+        acc = sm2.j_double(acc)
+        for table, ds in zip(tables, digits):
+            if i >= len(ds) or ds[i] == 0:
+                continue
+            T = table[abs(ds[i]) // 2]
+            acc = sm2.j_add(acc, T if ds[i] > 0 else (T[0], -T[1] % p, T[2]))
+    return sm2.from_jac(sm2.j_add(R, acc))
+
+
+@contextlib.contextmanager
+def generic_formulas():
+    """临时换回优化前的代码路径：任意 a 的倍点、仿射点按 Z=1 的 Jacobian 点做一般加法，
+    一次性的多标量乘使用不规范化的 Jacobian 奇数倍表"""
+    saved = sm2.j_double, sm2.j_add_affine, sm2.multi_scalar_mul
+    sm2.j_double = sm2.j_double_generic
+    sm2.j_add_affine = lambda P, Q: sm2.j_add(P, (Q[0], Q[1], FieldElement(1)))
+    sm2.multi_scalar_mul = jacobian_multi_scalar_mul
+    try:
+        yield
+    finally:
+        sm2.j_double, sm2.j_add_affine, sm2.multi_scalar_mul = saved
+
+
+@contextlib.contextmanager
+def counted_inputs():
+    """临时把 G 的预计算表与 to_jac 的输出换成 FieldElement 坐标（包括 Z=1）"""
+    saved = sm2._G_COMB, sm2.to_jac
+    to_jac = sm2.to_jac
+    sm2._G_COMB = [[counted(Q) for Q in window] for window in saved[0]]
+    sm2.to_jac = lambda P: counted(to_jac(P))
+    try:
+        yield
+    finally:
+        sm2._G_COMB, sm2.to_jac = saved
+
+
+def count_ops(fn: Callable[[], object]) -> Dict[str, int]:
+    FieldElement.reset()
+    fn()
+    return dict(FieldElement.counts)
+
+
+def operations(k: int, t: int) -> Dict[str, Callable[[], object]]:
+    """各项待统计的操作；输入点已换成 FieldElement 坐标"""
+    G = counted((Gx, Gy))
+    GJ = counted(sm2.j_double(sm2.to_jac((Gx, Gy))))
+    P = counted(sm2.scalar_mul_G(k))
+    verifier = sm2.Verifier(P)
+    return {
+        '倍点 j_double': lambda: sm2.j_double(GJ),
+        '一般加法 j_add': lambda: sm2.j_add(GJ, sm2.to_jac(G)),
+        '混合加法 j_add_affine': lambda: sm2.j_add_affine(GJ, G),
+        'scalar_mul_G': lambda: sm2.scalar_mul_G(k),
+        'scalar_mul': lambda: sm2.scalar_mul(P, t),
+        '验签 s·G + t·P（Verifier）': lambda: sm2.from_jac(verifier.point_jac((k, t))),
+    }
+
+
+def run(k: int, t: int) -> Dict[str, Dict[str, Dict[str, int]]]:
+    results = {}
+    with counted_inputs():
+        with generic_formulas():
+            results['一般公式'] = {name: count_ops(fn) for name, fn in operations(k, t).items()}
+        results['a=-3 + 混合加法'] = {name: count_ops(fn) for name, fn in operations(k, t).items()}
+    return results
+
+
+def bench_time(min_time: float) -> Dict[str, float]:
+    """普通整数下各操作的平均耗时（毫秒）"""
+    k = secrets.randbelow(n - 1) + 1
+    P = sm2.scalar_mul_G(secrets.randbelow(n - 1) + 1)
+    verifier = sm2.Verifier(P)
+    sig = (secrets.randbelow(n - 1) + 1, secrets.randbelow(n - 1) + 1)
+    fns = {
+        'scalar_mul_G': lambda: sm2.scalar_mul_G(k),
+        'scalar_mul': lambda: sm2.scalar_mul(P, k),
+        '验签 s·G + t·P（Verifier）': lambda: sm2.from_jac(verifier.point_jac(sig)),
+    }
+    result = {}
+    for name, fn in fns.items():
+        runs = 0
+        start = time.perf_counter()
+        while runs == 0 or time.perf_counter() - start < min_time:
+            fn()
+            runs += 1
+        result[name] = (time.perf_counter() - start) / runs * 1e3
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SM2 点运算的域运算次数统计与计时')
+    parser.add_argument('--min-time', type=float, default=0.5, help='每项计时的最短时间（秒）')
+    args = parser.parse_args(argv)
+
+    # 标量固定为随机值，两种公式统计同一组运算
+    k = secrets.randbelow(n - 1) + 1
+    t = secrets.randbelow(n - 1) + 1
+    results = run(k, t)
+    baseline, current = results['一般公式'], results['a=-3 + 混合加法']
+    print(f"求逆按平方-乘法折算为 {INVERSION_M} 次乘法（M-eq = M + S + I×{INVERSION_M}）")
+    print(f"{'操作':<28} {'一般公式 M/S/I':>18} {'a=-3 + 混合加法 M/S/I':>24} {'M-eq 减少':>10}")
+    for name in baseline:
+        old, new = baseline[name], current[name]
+        old_eq, new_eq = m_equivalent(old), m_equivalent(new)
+        saved = 1 - new_eq / old_eq if old_eq else 0.0
+        print(f"{name:<28} {old['M']:>8}/{old['S']}/{old['I']:<6} "
+              f"{new['M']:>12}/{new['S']}/{new['I']:<8} {saved:>9.1%}   ({old_eq} -> {new_eq})")
+
+    print()
+    for name, ms in bench_time(args.min_time).items():
+        print(f"{name:<28} {ms:10.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())